@@ -0,0 +1,382 @@
+"""
+অফলাইন benchmark: লোকাল aiohttp সার্ভার আর নকল Telegram client দিয়ে
+download_url_generic, download_drive_file ও process_file_and_upload মাপা হয়।
+
+ব্যবহার:
+    python benchmark.py --size 256 --bandwidth 50 --latency 20 --segments 4
+    python benchmark.py --scenario drive --no-ranges --fail-rate 0.2
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import random
+import hashlib
+import asyncio
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+
+# main.py import এর আগেই env আর working dir ঠিক করতে হবে (TMP/DATA_DIR relative path)
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "bench")
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+BENCH_DIR = Path(tempfile.mkdtemp(prefix="urlbot_bench_"))
+# sqlite ক্যাশ, thumb আর tmp ফাইল সব এখানে; চালানো শেষে মুছে যায়
+atexit.register(shutil.rmtree, BENCH_DIR, ignore_errors=True)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.chdir(BENCH_DIR)
+
+import main  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+MB = 1024 * 1024
+CHUNK = 64 * 1024
+
+
+class ServerConfig:
+    def __init__(self, bandwidth=0.0, latency=0.0, ranges=True, fail_rate=0.0, seed=1):
+        self.bandwidth = bandwidth  # bytes/sec প্রতি কানেকশন, 0 = সীমা নেই
+        self.latency = latency  # সেকেন্ড, প্রতিটি রেসপন্স শুরুর আগে
+        self.ranges = ranges
+        self.fail_rate = fail_rate  # এই সম্ভাবনায় বডির মাঝপথে কানেকশন কেটে দেওয়া হবে
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+
+
+def synthetic_block(offset: int, length: int) -> bytes:
+    # offset থেকে নির্ধারিত প্যাটার্ন, যাতে Range এর অংশগুলো জোড়া দিলে একই ফাইল হয়
+    pattern = bytes(range(256)) * (CHUNK // 256 + 2)
+    start = offset % 256
+    out = bytearray()
+    while len(out) < length:
+        n = min(CHUNK, length - len(out))
+        out += pattern[start:start + n]
+        start = (start + n) % 256
+    return bytes(out[:length])
+
+
+async def serve_bytes(request, cfg: ServerConfig, size: int, extra_headers=None):
+    cfg.requests += 1
+    if cfg.latency:
+        await asyncio.sleep(cfg.latency)
+    headers = {"Content-Type": "application/octet-stream", "ETag": f'"bench-{size}"'}
+    headers.update(extra_headers or {})
+    if cfg.ranges:
+        headers["Accept-Ranges"] = "bytes"
+    start, end, status = 0, size - 1, 200
+    rng = request.headers.get("Range")
+    if cfg.ranges and rng and rng.startswith("bytes="):
+        first, _, last = rng[6:].partition("-")
+        start = int(first or 0)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return web.Response(status=status, headers=headers)
+
+    resp = web.StreamResponse(status=status, headers=headers)
+    await resp.prepare(request)
+    fail_at = None
+    if cfg.fail_rate and cfg.random.random() < cfg.fail_rate:
+        fail_at = cfg.random.randint(0, max(0, length - 1))
+    sent = 0
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    try:
+        while sent < length:
+            n = min(CHUNK, length - sent)
+            if fail_at is not None and sent + n > fail_at:
+                cfg.failures += 1
+                request.transport.close()
+                return resp
+            await resp.write(synthetic_block(start + sent, n))
+            sent += n
+            if cfg.bandwidth:
+                ahead = sent / cfg.bandwidth - (loop.time() - began)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await resp.write_eof()
+    except ConnectionError:
+        # client নিজেই কানেকশন ছেড়ে দিয়েছে (যেমন segmented মোডের প্রথম রেসপন্স)
+        pass
+    return resp
+
+
+DRIVE_FORM = """<!DOCTYPE html><html><head><title>Google Drive - Virus scan warning</title></head><body>
+<form id="download-form" action="{action}" method="get">
+<input type="submit" id="uc-download-link" value="Download anyway"/>
+<input type="hidden" name="id" value="{file_id}">
+<input type="hidden" name="export" value="download">
+<input type="hidden" name="confirm" value="t">
+<input type="hidden" name="uuid" value="0000-bench">
+</form></body></html>"""
+
+
+def make_app(cfg: ServerConfig, confirm_over: int) -> web.Application:
+    async def file_handler(request):
+        return await serve_bytes(request, cfg, int(request.match_info["size"]))
+
+    async def drive_uc(request):
+        # file id হিসেবে সাইজ পাঠানো হয়; বড় ফাইল হলে আগে confirm পেজ
+        size = int(request.query["id"])
+        if size > confirm_over and "confirm" not in request.query:
+            cfg.requests += 1
+            action = str(request.url.with_path("/download").with_query({}))
+            return web.Response(text=DRIVE_FORM.format(action=action, file_id=size), content_type="text/html")
+        return await drive_download(request)
+
+    async def drive_download(request):
+        if request.query.get("confirm") != "t" and int(request.query["id"]) > confirm_over:
+            return web.Response(status=403, text="confirm missing")
+        size = int(request.query["id"])
+        return await serve_bytes(request, cfg, size, {"Content-Disposition": f'attachment; filename="drive_{size}.bin"'})
+
+    app = web.Application()
+    app.router.add_get("/file/{size}", file_handler)
+    app.router.add_get("/uc", drive_uc)
+    app.router.add_get("/download", drive_download)
+    return app
+
+
+def expected_sha256(size: int) -> str:
+    h = hashlib.sha256()
+    for off in range(0, size, MB):
+        h.update(synthetic_block(off, min(MB, size - off)))
+    return h.hexdigest()
+
+
+class Recorder:
+    def __init__(self):
+        self.edits = 0
+        self.replies = 0
+        self.uploads = []
+
+
+class FakeMedia:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class FakeUser:
+    def __init__(self, uid):
+        self.id = uid
+
+
+class FakeMessage:
+    """pyrogram Message এর যতটুকু main.py ব্যবহার করে ততটুকু।"""
+
+    _ids = 0
+
+    def __init__(self, recorder: Recorder, uid=main.ADMIN_ID, text=""):
+        FakeMessage._ids += 1
+        self.id = FakeMessage._ids
+        self.recorder = recorder
+        self.from_user = FakeUser(uid)
+        self.chat = FakeUser(uid)
+        self.text = text
+        self.video = None
+        self.document = None
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.recorder.edits += 1
+        return self
+
+    edit = edit_text
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        self.recorder.replies += 1
+        return FakeMessage(self.recorder, self.from_user.id, text)
+
+
+class FakeClient:
+    """send_video/send_document এর নকল: ফাইল পড়ে, নির্দিষ্ট গতিতে pyrogram এর মত progress ডাকে।"""
+
+    PART = 512 * 1024
+
+    def __init__(self, recorder: Recorder, upload_bandwidth=0.0):
+        self.recorder = recorder
+        self.upload_bandwidth = upload_bandwidth
+
+    async def _upload(self, path, progress=None, progress_args=()):
+        size = os.path.getsize(path)
+        loop = asyncio.get_running_loop()
+        began = loop.time()
+        done = 0
+        with open(path, "rb") as f:
+            while True:
+                part = f.read(self.PART)
+                if not part:
+                    break
+                done += len(part)
+                if self.upload_bandwidth:
+                    ahead = done / self.upload_bandwidth - (loop.time() - began)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+                if progress:
+                    await progress(done, size, *progress_args)
+        return size
+
+    async def _send(self, kind, chat_id, path, progress, progress_args, **kwargs):
+        size = await self._upload(path, progress, progress_args)
+        self.recorder.uploads.append({"kind": kind, "size": size, **{k: v for k, v in kwargs.items() if k in ("duration", "file_name")}})
+        msg = FakeMessage(self.recorder, chat_id)
+        setattr(msg, kind, FakeMedia(f"bench-{kind}-{len(self.recorder.uploads)}"))
+        return msg
+
+    async def send_video(self, chat_id, video, progress=None, progress_args=(), **kwargs):
+        return await self._send("video", chat_id, video, progress, progress_args, **kwargs)
+
+    async def send_document(self, chat_id, document, progress=None, progress_args=(), **kwargs):
+        return await self._send("document", chat_id, document, progress, progress_args, **kwargs)
+
+    async def send_cached_media(self, chat_id, file_id, caption=None, **kwargs):
+        self.recorder.uploads.append({"kind": "cached", "size": 0})
+        return FakeMessage(self.recorder, chat_id)
+
+
+class Measure:
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        # Linux এ ru_maxrss KB তে আসে
+        self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return False
+
+    def row(self, ok, err, recorder: Recorder, server: ServerConfig, verified=None):
+        return {
+            "scenario": self.name,
+            "ok": ok,
+            "verified": "-" if verified is None else verified,
+            "error": err,
+            "MB": round(self.nbytes / MB, 2),
+            "seconds": round(self.wall, 3),
+            "MB/s": round(self.nbytes / MB / self.wall, 2) if ok and self.wall else 0,
+            "cpu_s": round(self.cpu, 3),
+            "peak_rss_MB": round(self.peak_rss, 1),
+            "edits": recorder.edits,
+            "http_requests": server.requests,
+            "injected_failures": server.failures,
+        }
+
+
+async def bench_generic(base, cfg, size, segments):
+    rec = Recorder()
+    out = main.TMP / f"bench_generic_{segments}.bin"
+    hasher = main.StreamHash()
+    with Measure(f"download_url_generic(segments={segments})", size) as m:
+        ok, err = await main.download_url_generic(f"{base}/file/{size}", out, FakeMessage(rec), segments=segments, hasher=hasher)
+    out.unlink(missing_ok=True)
+    return m.row(ok, err, rec, cfg, ok and hasher.hexdigest() == expected_sha256(size))
+
+
+async def bench_drive(base, cfg, size):
+    rec = Recorder()
+    out = main.TMP / "bench_drive.bin"
+    main.DRIVE_DOWNLOAD_URL = f"{base}/uc"
+    hasher = main.StreamHash()
+    with Measure("download_drive_file", size) as m:
+        ok, err = await main.download_drive_file(str(size), out, FakeMessage(rec), hasher=hasher)
+    out.unlink(missing_ok=True)
+    return m.row(ok, err, rec, cfg, ok and hasher.hexdigest() == expected_sha256(size))
+
+
+async def bench_upload(cfg, size, upload_bandwidth, video):
+    rec = Recorder()
+    path = main.TMP / ("bench_upload.mp4" if video else "bench_upload.bin")
+    with path.open("wb") as f:
+        for off in range(0, size, MB):
+            f.write(synthetic_block(off, min(MB, size - off)))
+    with Measure("process_file_and_upload", size) as m:
+        await main.process_file_and_upload(FakeClient(rec, upload_bandwidth), FakeMessage(rec), path)
+    ok = bool(rec.uploads)
+    main.LAST_FILE.clear()
+    path.unlink(missing_ok=True)
+    return m.row(ok, None if ok else "upload হয়নি", rec, cfg)
+
+
+async def run(args):
+    cfg = ServerConfig(
+        bandwidth=args.bandwidth * MB,
+        latency=args.latency / 1000,
+        ranges=not args.no_ranges,
+        fail_rate=args.fail_rate,
+        seed=args.seed,
+    )
+    runner = web.AppRunner(make_app(cfg, confirm_over=args.drive_confirm_over * MB))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    base = f"http://{host}:{port}"
+    size = int(args.size * MB)
+    scenarios = args.scenario or ["generic", "segmented", "drive", "upload"]
+    rows = []
+    try:
+        for name in scenarios:
+            cfg.requests = cfg.failures = 0
+            if name == "generic":
+                rows.append(await bench_generic(base, cfg, size, 1))
+            elif name == "segmented":
+                rows.append(await bench_generic(base, cfg, size, args.segments))
+            elif name == "drive":
+                rows.append(await bench_drive(base, cfg, size))
+            elif name == "upload":
+                rows.append(await bench_upload(cfg, size, args.upload_bandwidth * MB, args.video))
+    finally:
+        await main.close_http_session()
+        await runner.cleanup()
+    return rows
+
+
+def print_table(rows):
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="URL uploader pipeline benchmark (সম্পূর্ণ অফলাইন)")
+    p.add_argument("--scenario", action="append", choices=["generic", "segmented", "drive", "upload"],
+                   help="একাধিকবার দেওয়া যায়; না দিলে সবগুলো চলবে")
+    p.add_argument("--size", type=float, default=64, help="ফাইলের সাইজ (MB)")
+    p.add_argument("--bandwidth", type=float, default=0, help="প্রতি কানেকশনের সর্বোচ্চ গতি (MB/s), 0 = সীমা নেই")
+    p.add_argument("--upload-bandwidth", type=float, default=0, help="নকল Telegram আপলোড গতি (MB/s)")
+    p.add_argument("--latency", type=float, default=0, help="প্রতি রেসপন্সের আগে দেরি (ms)")
+    p.add_argument("--no-ranges", action="store_true", help="সার্ভার Range সাপোর্ট করবে না")
+    p.add_argument("--fail-rate", type=float, default=0, help="প্রতি রেসপন্স মাঝপথে কেটে যাওয়ার সম্ভাবনা")
+    p.add_argument("--segments", type=int, default=main.DOWNLOAD_SEGMENTS)
+    p.add_argument("--drive-confirm-over", type=float, default=1, help="এর বড় (MB) Drive ফাইলে confirm পেজ")
+    p.add_argument("--video", action="store_true", help="upload scenario তে .mp4 নাম ব্যবহার")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", action="store_true", help="টেবিলের বদলে JSON আউটপুট")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print_table(rows)
@@ -1,16 +1,35 @@
 import os
+import io
 import re
+import html
+import math
+import mimetypes
 import aiohttp
 import asyncio
+import contextvars
+import contextlib
+import functools
 from pathlib import Path
 from datetime import datetime
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle, raw, types
+from pyrogram.errors import BadRequest, FloodWait
 from pyrogram.types import Message, BotCommand, InlineKeyboardMarkup, InlineKeyboardButton
 from PIL import Image
 from hachoir.parser import createParser
 from hachoir.metadata import extractMetadata
-import subprocess
+import json
+import time
+import errno
+import shutil
+import struct
+import sqlite3
+import hashlib
 import traceback
+from urllib.parse import urlsplit, urlunsplit, urlencode, parse_qsl, urljoin
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, deque
+from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
 
 # Environment variables থেকে নিন
 API_ID = int(os.getenv("API_ID"))
@@ -19,15 +38,308 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 TMP = Path("tmp")
 TMP.mkdir(parents=True, exist_ok=True)
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))  # ক্যাশ/ডাটাবেস এর মত স্থায়ী ফাইল
+DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 USER_THUMBS = {}
-LAST_FILE = {}
-TASKS = {}
+USER_THUMB_DATA = {}  # uid -> প্রস্তুত (320px JPEG) থাম্বনেইলের bytes, যাতে প্রতি আপলোডে ডিস্ক থেকে পড়তে না হয়
+LAST_FILE = OrderedDict()  # uid -> শেষ আপলোড করা ফাইল, পুরনোটা আগে (LRU)
+RESERVATIONS = {}  # TMP path -> ডাউনলোডের জন্য রাখা bytes
+JOBS = {}  # job id -> Job (কিউতে থাকা ও চলমান সব কাজ)
+JOB_QUEUE = asyncio.Queue()
+LAST_JOB_ID = 0  # রিস্টার্টের পরও id যাতে আগের Cancel বাটনের সাথে না মেলে, তাই journal এ রাখা হয়
+CURRENT_JOB = contextvars.ContextVar("current_job", default=None)
 ADMIN_ID = 6473423613  # আপনার Telegram user id এখানে রাখুন
 MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2GB max size
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))  # একসাথে কয়টি Range কানেকশন
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024  # এর চেয়ে ছোট অংশে ভাগ করা হবে না
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "5"))  # সেকেন্ড, progress edit এর নিয়মিত বিরতি
+PROGRESS_STEP = float(os.getenv("PROGRESS_STEP", "10"))  # এত শতাংশ এগোলে আগেভাগে edit
+PROGRESS_MIN_GAP = float(os.getenv("PROGRESS_MIN_GAP", "2"))  # দুই edit এর মাঝে অন্তত এত সেকেন্ড
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # মোট কানেকশন সীমা
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "16"))  # প্রতি হোস্টে কানেকশন সীমা
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))  # DNS cache (সেকেন্ড)
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))  # idle keep-alive কানেকশন কতক্ষণ রাখা হবে
+STREAM_UPLOAD = os.getenv("STREAM_UPLOAD", "1") == "1"  # ডাউনলোড চলাকালীনই Telegram এ আপলোড
+STREAM_PART_SIZE = 512 * 1024  # Telegram upload part এর সর্বোচ্চ সাইজ
+STREAM_BUFFER_PARTS = int(os.getenv("STREAM_BUFFER_PARTS", "16"))  # মেমরিতে সর্বোচ্চ কয়টি part জমা থাকবে
+STREAM_UPLOAD_WORKERS = int(os.getenv("STREAM_UPLOAD_WORKERS", "4"))  # একসাথে কয়টি part আপলোড হবে
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024  # এর বড় ফাইল Telegram এ "big file" হিসেবে যায়
+VIDEO_EXTS = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm"}
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))  # একসাথে কয়টি ডাউনলোড চলবে
+UPLOAD_BOT_TOKENS = [t.strip() for t in os.getenv("UPLOAD_BOT_TOKENS", "").split(",") if t.strip()]  # আপলোডের জন্য বাড়তি বট (কমা দিয়ে আলাদা)
+UPLOAD_CHANNEL_ID = int(os.getenv("UPLOAD_CHANNEL_ID", "0"))  # বাড়তি বটগুলো এখানে আপলোড করবে, পরে মূল বট কপি করবে; 0 = সরাসরি ইউজারকে
+UPLOAD_SESSION_BENCH = float(os.getenv("UPLOAD_SESSION_BENCH", "300"))  # অন্য ত্রুটিতে বাড়তি বট কত সেকেন্ড বাদ থাকবে
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", str(1 + len(UPLOAD_BOT_TOKENS))))  # একসাথে কয়টি Telegram আপলোড চলবে
+UPLOAD_SLOTS = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", "2"))  # hachoir parse এর জন্য thread সংখ্যা
+PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="probe")
+PROBE_CACHE = OrderedDict()  # (path, size, mtime) -> duration/width/height
+PROBE_CACHE_MAX = 256
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "120"))  # সেকেন্ড
+THUMB_DIR = DATA_DIR / "thumbs"  # ইউজারের কাস্টম থাম্বনেইল, রিস্টার্টেও থাকে
+THUMB_DIR.mkdir(parents=True, exist_ok=True)
+THUMB_CACHE_DIR = DATA_DIR / "thumb_cache"  # ভিডিও থেকে বানানো থাম্বনেইল, কনটেন্ট hash দিয়ে
+THUMB_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+THUMB_CACHE_MAX = int(os.getenv("THUMB_CACHE_MAX", "500"))  # সর্বোচ্চ কয়টি থাম্বনেইল রাখা হবে
+THUMB_POSITION = float(os.getenv("THUMB_POSITION", "0.1"))  # ভিডিওর কত অংশে (0-1) ফ্রেম নেওয়া হবে
+THUMB_SAMPLE = 1024 * 1024  # fingerprint এর জন্য শুরু/মাঝ/শেষ থেকে এতটুকু করে পড়া হয়
+JOURNAL_PATH = DATA_DIR / "journal.json"
+JOURNAL_INTERVAL = float(os.getenv("JOURNAL_INTERVAL", "2"))  # সেকেন্ড
+JOURNAL_DIRTY = False
+UPLOAD_CACHE_DB = DATA_DIR / "upload_cache.sqlite3"
+UPLOAD_CACHE_MAX = int(os.getenv("UPLOAD_CACHE_MAX", "5000"))  # সর্বোচ্চ কয়টি key মনে রাখা হবে
+UPLOAD_CACHE = None
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc"
+DRIVE_SNIFF_BYTES = 256 * 1024  # HTML পেজ চেনার জন্য সর্বোচ্চ এতটুকু পড়া হবে
+TMP_QUOTA = int(os.getenv("TMP_QUOTA_MB", "0")) * 1024 * 1024  # TMP এর সর্বোচ্চ ব্যবহার, 0 = সীমা নেই
+DISK_MIN_FREE = int(os.getenv("DISK_MIN_FREE_MB", "200")) * 1024 * 1024  # ডিস্কে অন্তত এতটুকু খালি রাখা হবে
+LAST_FILE_MAX_BYTES = int(os.getenv("LAST_FILE_MAX_MB", "2048")) * 1024 * 1024  # LAST_FILE এর ফাইল মোট এতটুকু পর্যন্ত রাখা হবে
+WORKSPACE_WAIT = float(os.getenv("WORKSPACE_WAIT", "1800"))  # জায়গার জন্য সর্বোচ্চ কত সেকেন্ড অপেক্ষা
+ORPHAN_AGE = float(os.getenv("ORPHAN_AGE", "3600"))  # এর চেয়ে পুরনো অব্যবহৃত TMP ফাইল মুছে ফেলা হবে
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "900"))  # সেকেন্ড
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "5"))  # কানেকশন কাটলে কতবার resume চেষ্টা
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "2"))  # প্রথম অপেক্ষা (সেকেন্ড), প্রতিবার দ্বিগুণ
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "60"))
+PART_META_INTERVAL = 2.0  # .part.json কত সেকেন্ড পরপর আপডেট হবে
+WRITE_BUFFER_SIZE = int(os.getenv("WRITE_BUFFER_MB", "2")) * 1024 * 1024  # এতটুকু জমলে ডিস্কে লেখা হবে
+WRITE_BUFFERS = int(os.getenv("WRITE_BUFFERS", "3"))  # প্রতিটি ফাইলে সর্বোচ্চ কয়টি buffer লেখার অপেক্ষায় থাকবে
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "8"))  # HLS/DASH এর কয়টি segment একসাথে নামবে
+MANIFEST_MAX_BYTES = 8 * 1024 * 1024  # এর বড় playlist পড়া হবে না
+MERGE_TIMEOUT = float(os.getenv("MERGE_TIMEOUT", "1800"))  # segment জোড়া লাগানোর ffmpeg এর সময়সীমা (সেকেন্ড)
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "20"))  # এক মেসেজে সর্বোচ্চ কয়টি URL
+URL_RE = re.compile(r"https?://\S+")
+VOLUME_SIZE = min(int(os.getenv("VOLUME_SIZE_MB", "1950")) * 1024 * 1024, MAX_SIZE)  # 2GB এর বড় ফাইলের প্রতিটি অংশ
+VOLUME_KEEP = int(os.getenv("VOLUME_KEEP", "2"))  # আপলোডের অপেক্ষায় সর্বোচ্চ কয়টি অংশ ডিস্কে থাকবে
+VOLUME_MODE = os.getenv("VOLUME_MODE", "auto")  # auto: ভিডিও হলে ffmpeg segment, নাহলে বাইট ভাগ; raw: সবসময় বাইট ভাগ
+VOLUME_MARGIN = 0.5  # ffmpeg segment এর সময় হিসাবের সময় বিটরেট ওঠানামার (VBR) আর দেরিতে আসা keyframe এর জন্য ছাড়
+VOLUME_SNIFF_BYTES = 16 * 1024 * 1024  # ভিডিওর দৈর্ঘ্য বের করতে শুরুর এতটুকু পড়া হয়
+STATS_WINDOW = int(os.getenv("STATS_WINDOW", "500"))  # প্রতিটি মাপের শেষ কয়টি নমুনা থেকে p50/p95
+STATS_DAYS = 7  # কত দিনের দৈনিক বাইট হিসাব রাখা হবে
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics এর পোর্ট, 0 = বন্ধ
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+STATS = {}  # মাপের নাম -> শেষ STATS_WINDOW টি নমুনা
+STATS_BYTES = OrderedDict()  # "YYYY-MM-DD" -> {"down": bytes, "up": bytes}
+STATS_TOTALS = {"down": 0, "up": 0}  # চালুর পর থেকে মোট বাইট
+STATS_JOBS = {}  # শেষ অবস্থা -> job সংখ্যা
+CANCEL_MSG = "অপারেশন ব্যবহারকারী দ্বারা বাতিল করা হয়েছে।"
+SIZE_LIMIT_MSG = "ফাইলের সাইজ 2GB এর বেশি হতে পারে না।"
+
+HTTP_SESSION = None  # পুরো অ্যাপের জন্য একটাই aiohttp session
 
 app = Client("mybot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 
+class DownloadAborted(Exception):
+    # বাতিল/সাইজ সীমা/4xx: আবার চেষ্টা করে লাভ নেই
+    pass
+
+class RestartDownload(Exception):
+    # সার্ভার Range মানছে না বা ফাইল বদলে গেছে, শুরু থেকে নামাতে হবে
+    pass
+
+class VolumeHandoff(DownloadAborted):
+    # 2GB পেরোনো ডাউনলোড চলমান রেসপন্স সহ অংশে ভাগের কাজে চলে গেছে, এই ডাউনলোড এখানেই শেষ
+    pass
+
+class RetryableHTTPError(Exception):
+    pass
+
+class StreamHash:
+    """hashlib এর মত, তবে reset() করা যায় (ডাউনলোড শুরু থেকে আবার হলে লাগে)।"""
+
+    def __init__(self, name: str = "sha256"):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self._h = hashlib.new(self.name)
+
+    def update(self, data):
+        self._h.update(data)
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, RetryableHTTPError)
+
+def stat_sample(name: str, value: float):
+    STATS.setdefault(name, deque(maxlen=STATS_WINDOW)).append(value)
+
+def job_metric(name: str, value: float):
+    """চলমান job এর কোনো phase এ সময় (বা বাইট) যোগ করে; job না থাকলে সরাসরি সারাংশে যায়।"""
+    job = CURRENT_JOB.get()
+    if job is None:
+        stat_sample(name, value)
+        return
+    job.metrics[name] = job.metrics.get(name, 0) + value
+
+def count_bytes(direction: str, n: int):
+    # direction: "down" বা "up"
+    day = datetime.now().strftime("%Y-%m-%d")
+    STATS_BYTES.setdefault(day, {"down": 0, "up": 0})[direction] += n
+    while len(STATS_BYTES) > STATS_DAYS:
+        STATS_BYTES.popitem(last=False)
+    STATS_TOTALS[direction] += n
+    job = CURRENT_JOB.get()
+    if job is not None:
+        job.metrics[f"{direction}_bytes"] = job.metrics.get(f"{direction}_bytes", 0) + n
+
+@contextlib.contextmanager
+def phase_timer(name: str):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        job_metric(name, time.monotonic() - start)
+
+def timed(name: str):
+    """async ফাংশনের পুরো সময়টা `name` phase হিসেবে গোনার decorator।"""
+    def wrap(func):
+        @functools.wraps(func)
+        async def inner(*args, **kwargs):
+            with phase_timer(name):
+                return await func(*args, **kwargs)
+        return inner
+    return wrap
+
+def http_sample(stage: str, value: float):
+    # প্রতিটি রিকোয়েস্ট সারাংশে যায়; job এ শুধু প্রথমটার মান থাকে
+    stat_sample(f"http_{stage}", value)
+    job = CURRENT_JOB.get()
+    if job is not None:
+        job.http.setdefault(stage, value)
+
+def http_trace_config() -> aiohttp.TraceConfig:
+    """DNS, TCP/TLS connect আর TTFB (রেসপন্স হেডার আসা পর্যন্ত) মাপার জন্য aiohttp trace।"""
+    tc = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.start = time.monotonic()
+
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_start = time.monotonic()
+
+    async def on_dns_end(session, ctx, params):
+        http_sample("dns", time.monotonic() - ctx.dns_start)
+
+    async def on_connect_start(session, ctx, params):
+        ctx.connect_start = time.monotonic()
+
+    async def on_connect_end(session, ctx, params):
+        http_sample("connect", time.monotonic() - ctx.connect_start)
+
+    async def on_request_end(session, ctx, params):
+        http_sample("ttfb", time.monotonic() - ctx.start)
+
+    tc.on_request_start.append(on_request_start)
+    tc.on_dns_resolvehost_start.append(on_dns_start)
+    tc.on_dns_resolvehost_end.append(on_dns_end)
+    tc.on_connection_create_start.append(on_connect_start)
+    tc.on_connection_create_end.append(on_connect_end)
+    tc.on_request_end.append(on_request_end)
+    return tc
+
+def record_job_stats(job):
+    """শেষ হওয়া job এর phase সময় ও গতি rolling সারাংশে যোগ করে।"""
+    STATS_JOBS[job.status] = STATS_JOBS.get(job.status, 0) + 1
+    for name, value in job.metrics.items():
+        if not name.endswith("_bytes"):
+            stat_sample(name, value)
+    for direction, phase in (("down", "download"), ("up", "upload"), ("up", "stream")):
+        n = job.metrics.get(f"{direction}_bytes")
+        seconds = job.metrics.get(phase)
+        if n and seconds:
+            stat_sample(f"{phase}_speed", n / seconds)
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def format_stat(name: str, values) -> str:
+    p50, p95 = percentile(values, 0.5), percentile(values, 0.95)
+    if name.endswith("_speed"):
+        return f"{name}: p50 {p50 / (1024 * 1024):.2f} MB/s, p95 {p95 / (1024 * 1024):.2f} MB/s (n={len(values)})"
+    if name.startswith("http_"):
+        return f"{name}: p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms (n={len(values)})"
+    return f"{name}: p50 {p50:.2f}s, p95 {p95:.2f}s (n={len(values)})"
+
+def stats_text() -> str:
+    jobs = ", ".join(f"{k} {v}" for k, v in sorted(STATS_JOBS.items())) or "এখনো কোনো job শেষ হয়নি"
+    lines = [f"Jobs: {jobs} | চলমান {len(JOBS)}", ""]
+    lines += [format_stat(name, values) for name, values in sorted(STATS.items())] or ["এখনো কোনো মাপ নেই"]
+    lines.append("")
+    lines.append("দৈনিক ডাটা:")
+    for day, b in reversed(STATS_BYTES.items()):
+        lines.append(f"{day}: ↓ {b['down'] / (1024 ** 3):.2f} GB, ↑ {b['up'] / (1024 ** 3):.2f} GB")
+    return "\n".join(lines)
+
+def metrics_text() -> str:
+    """/metrics এর জন্য Prometheus text format।"""
+    families = {}
+    for name, values in sorted(STATS.items()):
+        if name.startswith("http_"):
+            family, label = "uploader_http_seconds", f'stage="{name[5:]}"'
+        elif name.endswith("_speed"):
+            family, label = "uploader_speed_bytes_per_second", f'phase="{name[:-6]}"'
+        else:
+            family, label = "uploader_phase_seconds", f'phase="{name}"'
+        rows = families.setdefault(family, [])
+        for q in (0.5, 0.95):
+            rows.append(f'{family}{{{label},quantile="{q}"}} {percentile(values, q)}')
+        rows.append(f"{family}_sum{{{label}}} {sum(values)}")
+        rows.append(f"{family}_count{{{label}}} {len(values)}")
+    lines = []
+    for family, rows in families.items():
+        lines.append(f"# TYPE {family} summary")
+        lines += rows
+    lines.append("# TYPE uploader_bytes_total counter")
+    lines += [f'uploader_bytes_total{{direction="{d}"}} {n}' for d, n in STATS_TOTALS.items()]
+    lines.append("# TYPE uploader_jobs_total counter")
+    lines += [f'uploader_jobs_total{{status="{s}"}} {n}' for s, n in sorted(STATS_JOBS.items())]
+    lines.append("# TYPE uploader_jobs_active gauge")
+    lines.append(f"uploader_jobs_active {len(JOBS)}")
+    return "\n".join(lines) + "\n"
+
+async def start_metrics_server():
+    """METRICS_PORT দেওয়া থাকলে লোকাল /metrics endpoint চালু করে।"""
+    if not METRICS_PORT:
+        return None
+
+    async def handler(request):
+        return web.Response(text=metrics_text(), content_type="text/plain")
+
+    webapp = web.Application()
+    webapp.router.add_get("/metrics", handler)
+    runner = web.AppRunner(webapp)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    return runner
+
+async def get_http_session() -> aiohttp.ClientSession:
+    global HTTP_SESSION
+    if HTTP_SESSION is None or HTTP_SESSION.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE,
+        )
+        HTTP_SESSION = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=3600),
+            headers={"User-Agent": "Mozilla/5.0"},
+            trace_configs=[http_trace_config()],
+        )
+    return HTTP_SESSION
+
+async def close_http_session():
+    global HTTP_SESSION
+    if HTTP_SESSION is not None and not HTTP_SESSION.closed:
+        await HTTP_SESSION.close()
+    HTTP_SESSION = None
+
 def is_admin(uid: int) -> bool:
     return uid == ADMIN_ID
 
@@ -42,116 +354,1740 @@ def extract_drive_id(url: str) -> str:
             return m.group(1)
     return None
 
-def get_video_duration(file_path: Path) -> int:
+def hash_file(file_path: Path, hasher, limit: int = None, chunk_size: int = 4 * 1024 * 1024):
+    remaining = limit
+    with file_path.open("rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and (parts.scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", query, ""))
+
+def upload_cache_db() -> sqlite3.Connection:
+    global UPLOAD_CACHE
+    if UPLOAD_CACHE is None:
+        UPLOAD_CACHE = sqlite3.connect(str(UPLOAD_CACHE_DB))
+        UPLOAD_CACHE.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "key TEXT PRIMARY KEY, file_id TEXT NOT NULL, is_video INTEGER NOT NULL, "
+            "name TEXT, last_used REAL NOT NULL)"
+        )
+        UPLOAD_CACHE.execute("CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads (last_used)")
+        UPLOAD_CACHE.commit()
+    return UPLOAD_CACHE
+
+def cache_lookup(key: str):
+    if not key:
+        return None
+    try:
+        db = upload_cache_db()
+        row = db.execute("SELECT file_id, is_video, name FROM uploads WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        db.execute("UPDATE uploads SET last_used = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+        return {"file_id": row[0], "is_video": bool(row[1]), "name": row[2]}
+    except sqlite3.Error as e:
+        print("Upload cache error:", e)
+        return None
+
+def cache_store(keys, file_id: str, is_video: bool, name: str):
+    keys = [k for k in keys or [] if k]
+    if not keys or not file_id:
+        return
+    try:
+        db = upload_cache_db()
+        now = time.time()
+        db.executemany(
+            "INSERT OR REPLACE INTO uploads (key, file_id, is_video, name, last_used) VALUES (?, ?, ?, ?, ?)",
+            [(k, file_id, int(is_video), name, now) for k in keys]
+        )
+        # সবচেয়ে কম ব্যবহৃত এন্ট্রি বাদ দিয়ে ক্যাশ UPLOAD_CACHE_MAX এর মধ্যে রাখি
+        db.execute(
+            "DELETE FROM uploads WHERE key IN (SELECT key FROM uploads ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (UPLOAD_CACHE_MAX,)
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        print("Upload cache error:", e)
+
+def cache_forget(key: str):
+    # file_id অচল হলে (যেমন BOT_TOKEN বদলেছে) একই file_id এর সব key মুছে দিই
+    if not key:
+        return
+    try:
+        db = upload_cache_db()
+        row = db.execute("SELECT file_id FROM uploads WHERE key = ?", (key,)).fetchone()
+        if row:
+            db.execute("DELETE FROM uploads WHERE file_id = ?", (row[0],))
+            db.commit()
+    except sqlite3.Error as e:
+        print("Upload cache error:", e)
+
+async def head_info(url: str):
+    try:
+        sess = await get_http_session()
+        async with sess.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+            if resp.status != 200:
+                return None
+            return {
+                "etag": resp.headers.get("ETag", ""),
+                "length": resp.headers.get("Content-Length", ""),
+                "type": resp.headers.get("Content-Type", ""),
+            }
+    except Exception:
+        return None
+
+def url_cache_key(url: str, info: dict):
+    # URL এর সাথে ETag/Content-Length মিলিয়ে key; কোনো validator না পেলে ক্যাশ ব্যবহার হবে না
+    if not info or (not info["etag"] and not info["length"]):
+        return None
+    return f"url:{normalize_url(url)}|{info['etag']}|{info['length']}"
+
+def message_file_id(msg: Message):
+    for attr in ("video", "document", "animation", "audio"):
+        media = getattr(msg, attr, None)
+        if media:
+            return media.file_id
+    return None
+
+async def send_cached_upload(c: Client, m: Message, hit: dict, caption: str = None):
+    await c.send_cached_media(chat_id=m.chat.id, file_id=hit["file_id"], caption=caption or hit["name"] or "")
+
+async def send_from_cache(c: Client, m: Message, key: str, caption: str = None):
+    """key ক্যাশে থাকলে file_id দিয়ে পাঠায়; পাঠানো না গেলে এন্ট্রি মুছে None ফেরত দেয় (তখন স্বাভাবিক আপলোড)।"""
+    hit = cache_lookup(key)
+    if not hit:
+        return None
+    try:
+        await send_cached_upload(c, m, hit, caption=caption)
+    except BadRequest as e:
+        # FILE_ID_INVALID, MEDIA_EMPTY ইত্যাদি: এই file_id আর কখনো চলবে না
+        print(f"Upload cache: {key} এর file_id অচল ({e}), এন্ট্রি মুছে দেওয়া হলো")
+        cache_forget(key)
+        return None
+    except Exception as e:
+        print(f"Upload cache: {key} এর file_id দিয়ে পাঠানো যায়নি ({e})")
+        return None
+    return hit
+
+def file_size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def preallocate_file(path: Path, size: int):
+    # fallocate দিয়ে আগেই ব্লক নিয়ে রাখি, তাহলে ডিস্ক ভরে গেলে শুরুতেই ধরা পড়ে
+    with path.open("wb") as f:
+        if size <= 0:
+            return
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise
+        f.truncate(size)
+
+def tmp_usage() -> int:
+    total = 0
+    for root, _, files in os.walk(TMP):
+        for name in files:
+            total += file_size(os.path.join(root, name))
+    return total
+
+def workspace_fits(size: int) -> bool:
+    # রিজার্ভ করা কিন্তু এখনো ডিস্কে না লেখা অংশও হিসাবে ধরি
+    pending = sum(max(0, n - max(file_size(p), file_size(p + ".part"))) for p, n in RESERVATIONS.items())
+    free = shutil.disk_usage(TMP).free - pending
+    if free - size < DISK_MIN_FREE:
+        return False
+    if TMP_QUOTA and tmp_usage() + pending + size > TMP_QUOTA:
+        return False
+    return True
+
+async def reserve_workspace(path: Path, size: int, cancel_event: asyncio.Event = None) -> bool:
+    """জায়গা থাকলে path এর নামে size bytes রিজার্ভ করে; না থাকলে পুরনো LAST_FILE মুছে বা অপেক্ষা করে দেখে।"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WORKSPACE_WAIT
+    while True:
+        if workspace_fits(size):
+            RESERVATIONS[str(path)] = size
+            return True
+        if evict_last_file():
+            continue
+        if (cancel_event and cancel_event.is_set()) or loop.time() >= deadline:
+            return False
+        await asyncio.sleep(5)
+
+def release_workspace(path: Path):
+    RESERVATIONS.pop(str(path), None)
+
+def drop_last_file_entry(entry: dict):
+    paths = [entry.get("path")]
+    thumb = entry.get("thumb")
+    if thumb and thumb not in USER_THUMBS.values():
+        paths.append(thumb)
+    for p in paths:
+        try:
+            if p and Path(p).exists():
+                Path(p).unlink()
+        except Exception:
+            pass
+
+def evict_last_file() -> bool:
+    if not LAST_FILE:
+        return False
+    _, entry = LAST_FILE.popitem(last=False)
+    drop_last_file_entry(entry)
+    return True
+
+def remember_last_file(uid: int, entry: dict):
+    old = LAST_FILE.pop(uid, None)
+    if old and old.get("path") != entry.get("path"):
+        drop_last_file_entry(old)
+    LAST_FILE[uid] = entry
+    while len(LAST_FILE) > 1 and sum(file_size(e["path"]) for e in LAST_FILE.values()) > LAST_FILE_MAX_BYTES:
+        evict_last_file()
+
+def sweep_workspace(min_age: float = None) -> int:
+    """কোনো job/LAST_FILE/থাম্বনেইলের সাথে যুক্ত নয় এমন পুরনো TMP ফাইল মুছে ফেলে।"""
+    min_age = ORPHAN_AGE if min_age is None else min_age
+    protected = set(RESERVATIONS) | set(USER_THUMBS.values())
+    for job in JOBS.values():
+        protected |= job.paths
+    for entry in LAST_FILE.values():
+        protected |= {entry.get("path"), entry.get("thumb")}
+    now = time.time()
+    removed = 0
+    for root, _, files in os.walk(TMP):
+        for name in files:
+            p = os.path.join(root, name)
+            if p in protected or root in protected:
+                continue
+            try:
+                if now - os.path.getmtime(p) >= min_age:
+                    os.unlink(p)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+async def workspace_janitor():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            removed = sweep_workspace()
+            if removed:
+                print(f"Workspace sweep: {removed} টি পুরনো ফাইল মুছে ফেলা হয়েছে")
+        except Exception:
+            traceback.print_exc()
+
+def read_media_info(file_path: Path) -> dict:
+    # hachoir ব্লকিং কাজ, তাই এটা সবসময় PROBE_EXECUTOR এ চালাতে হবে
+    info = {"duration": 0, "width": 0, "height": 0}
     try:
         parser = createParser(str(file_path))
         if not parser:
-            return 0
+            return info
         with parser:
             metadata = extractMetadata(parser)
-        if metadata and metadata.has("duration"):
-            return int(metadata.get("duration").total_seconds())
+        if not metadata:
+            return info
+        groups = [metadata] + list(metadata.iterGroups())
+        for meta in groups:
+            if not info["duration"] and meta.has("duration"):
+                info["duration"] = int(meta.get("duration").total_seconds())
+            if not info["width"] and meta.has("width"):
+                info["width"] = int(meta.get("width"))
+            if not info["height"] and meta.has("height"):
+                info["height"] = int(meta.get("height"))
     except Exception:
-        return 0
-    return 0
+        pass
+    return info
 
-def progress_keyboard():
+@timed("probe")
+async def probe_media(file_path: Path) -> dict:
+    """ফাইলের duration/width/height; একই ফাইলের জন্য একবারই parse হয়।"""
+    try:
+        st = file_path.stat()
+    except OSError:
+        return {"duration": 0, "width": 0, "height": 0}
+    key = (str(file_path), st.st_size, st.st_mtime_ns)
+    if key in PROBE_CACHE:
+        PROBE_CACHE.move_to_end(key)
+        return PROBE_CACHE[key]
+    loop = asyncio.get_running_loop()
+    info = await loop.run_in_executor(PROBE_EXECUTOR, read_media_info, file_path)
+    PROBE_CACHE[key] = info
+    while len(PROBE_CACHE) > PROBE_CACHE_MAX:
+        PROBE_CACHE.popitem(last=False)
+    return info
+
+async def run_ffmpeg(args: list, timeout: float = None) -> int:
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        return await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        proc.kill()
+        await proc.wait()
+        raise
+
+def progress_keyboard(job_id: int = None):
+    if job_id is None and CURRENT_JOB.get() is not None:
+        job_id = CURRENT_JOB.get().id
+    data = f"cancel_task:{job_id}" if job_id is not None else "cancel_task"
     return InlineKeyboardMarkup(
-        [[InlineKeyboardButton("Cancel ❌", callback_data="cancel_task")]]
+        [[InlineKeyboardButton("Cancel ❌", callback_data=data)]]
     )
 
-async def progress_callback(current, total, message: Message, start_time, task="Progress"):
-    try:
-        now = datetime.now()
-        diff = (now - start_time).total_seconds()
-        if diff == 0:
-            diff = 1
-        percentage = (current * 100 / total) if total else 0
-        speed = (current / diff / 1024 / 1024) if diff else 0  # MB/s
-        elapsed = int(diff)
-        eta = int((total - current) / (current / diff)) if current and diff else 0
-
-        done_blocks = int(percentage // 5)
-        if done_blocks < 0:
-            done_blocks = 0
-        if done_blocks > 20:
-            done_blocks = 20
-        progress_bar = ("█" * done_blocks).ljust(20, "░")
-        text = (
-            f"{task}...\n"
-            f"[{progress_bar}] {percentage:.2f}%\n"
-            f"{current / 1024 / 1024:.2f}MB of {total / 1024 / 1024 if total else 0:.2f}MB\n"
-            f"Speed: {speed:.2f} MB/s\n"
-            f"Elapsed: {elapsed}s | ETA: {eta}s\n\n"
-            "আপলোড/ডাউনলোড বাতিল করতে নিচের বাটনে চাপুন।"
-        )
+def format_progress(current, total, start_time, task="Progress") -> str:
+    now = datetime.now()
+    diff = (now - start_time).total_seconds()
+    if diff == 0:
+        diff = 1
+    percentage = (current * 100 / total) if total else 0
+    speed = (current / diff / 1024 / 1024) if diff else 0  # MB/s
+    elapsed = int(diff)
+    eta = int((total - current) / (current / diff)) if current and diff else 0
+
+    done_blocks = int(percentage // 5)
+    if done_blocks < 0:
+        done_blocks = 0
+    if done_blocks > 20:
+        done_blocks = 20
+    progress_bar = ("█" * done_blocks).ljust(20, "░")
+    return (
+        f"{task}...\n"
+        f"[{progress_bar}] {percentage:.2f}%\n"
+        f"{current / 1024 / 1024:.2f}MB of {total / 1024 / 1024 if total else 0:.2f}MB\n"
+        f"Speed: {speed:.2f} MB/s\n"
+        f"Elapsed: {elapsed}s | ETA: {eta}s\n\n"
+        "আপলোড/ডাউনলোড বাতিল করতে নিচের বাটনে চাপুন।"
+    )
+
+class ProgressReporter:
+    """ট্রান্সফার লুপ শুধু update() দিয়ে বাইট গোনে; Telegram edit হয় আলাদা ব্যাকগ্রাউন্ড টাস্ক থেকে।
+
+    প্রতি `interval` সেকেন্ডে একবার, অথবা `step` শতাংশ এগোলে (তবে `min_gap` এর আগে নয়) edit হয়।
+    একই টেক্সট আবার পাঠানো হয় না, আর FloodWait এলে সেই সময় পর্যন্ত অপেক্ষা করে।
+    """
+
+    def __init__(self, message: Message, task="Progress", start_time=None, total=0,
+                 interval=None, step=None, min_gap=None):
+        self.message = message
+        self.task = task
+        self.start_time = start_time or datetime.now()
+        self.current = 0
+        self.total = total or 0
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.step = PROGRESS_STEP if step is None else step
+        self.min_gap = PROGRESS_MIN_GAP if min_gap is None else min_gap
+        self.edits = 0
+        self._last_text = None
+        self._last_pct = 0.0
+        self._last_push = 0.0
+        self._wake = asyncio.Event()
+        self._runner = None
+        self.job = CURRENT_JOB.get()
+
+    def update(self, current, total=None):
+        self.current = current
+        if self.job is not None:
+            self.job.bytes_done = current
+        if total:
+            self.total = total
+        if self.total and self.step and (current * 100 / self.total) - self._last_pct >= self.step:
+            self._wake.set()
+
+    def add(self, n: int):
+        self.update(self.current + n)
+
+    def start(self):
+        if self.message and self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            gap = self.min_gap - (loop.time() - self._last_push)
+            if gap > 0:
+                await asyncio.sleep(gap)
+            await self._push()
+            self._last_push = loop.time()
+
+    async def _push(self):
+        text = format_progress(self.current, self.total, self.start_time, task=self.task)
+        if text == self._last_text:
+            return
         try:
-            await message.edit_text(text, reply_markup=progress_keyboard())
+            await self.message.edit_text(text, reply_markup=progress_keyboard())
+            self._last_text = text
+            self._last_pct = (self.current * 100 / self.total) if self.total else 0.0
+            self.edits += 1
+        except FloodWait as e:
+            await asyncio.sleep(getattr(e, "value", None) or getattr(e, "x", 5))
         except Exception:
             pass
-    except Exception:
-        pass
 
-async def download_stream(resp, out_path: Path, message: Message = None, start_time=None, task="Downloading", cancel_event: asyncio.Event = None):
-    total = 0
+class FileWriter:
+    """ডাউনলোডের chunk জমিয়ে বড় buffer বানায়, আর নিজস্ব thread থেকে ডিস্কে লেখে (event loop আটকায় না)।
+
+    WRITE_BUFFERS টি buffer লেখার অপেক্ষায় থাকলে write() থেমে থাকে, তাই নেটওয়ার্ক ডিস্কের চেয়ে দ্রুত
+    হলেও মেমরি সীমার মধ্যে থাকে। hasher দিলে লেখার সময় একই thread এ hash হয়, আলাদা করে ফাইল পড়তে হয় না।
+    flushed সবসময় ডিস্কে লেখা হয়ে যাওয়া অবস্থান (hasher ও ঠিক ততটুকু দেখেছে)।
+    """
+
+    def __init__(self, path: Path, mode: str = "r+b", offset: int = 0, hasher=None):
+        self.f = path.open(mode, buffering=0)
+        self.f.seek(offset)
+        self.flushed = offset
+        self.hasher = hasher
+        self.buf = bytearray()
+        self.pending = []
+        self.slots = asyncio.Semaphore(WRITE_BUFFERS)
+        self.error = None
+        self.closed = False
+        self.start = offset
+        self.write_seconds = 0.0
+        # একটাই thread, তাই buffer গুলো যে ক্রমে জমা হয় সেই ক্রমেই লেখা ও hash হয়
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+
+    def _write(self, data: bytes):
+        started = time.monotonic()
+        self.f.write(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+        self.write_seconds += time.monotonic() - started
+
+    def _done(self, fut):
+        self.pending.remove(fut)
+        self.slots.release()
+        if fut.cancelled():
+            return
+        err = fut.exception()
+        if err is not None:
+            self.error = self.error or err
+        else:
+            self.flushed += fut.size
+
+    async def write(self, chunk: bytes):
+        if self.error:
+            raise self.error
+        self.buf += chunk
+        if len(self.buf) >= WRITE_BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        """জমা buffer লেখার জন্য পাঠায়; এটা শেষ হওয়া পর্যন্ত অপেক্ষা করে না।"""
+        if not self.buf:
+            return
+        data, self.buf = bytes(self.buf), bytearray()
+        await self.slots.acquire()
+        fut = asyncio.get_running_loop().run_in_executor(self.executor, self._write, data)
+        fut.size = len(data)
+        self.pending.append(fut)
+        fut.add_done_callback(self._done)
+
+    async def drain(self):
+        await self.flush()
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        # done callback গুলো চলার সুযোগ দিই
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+
+    async def truncate(self):
+        await self.drain()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.f.truncate)
+
+    async def close(self):
+        """বাকি সব লিখে ফাইল বন্ধ করে; বারবার ডাকা যায়।"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.drain()
+        finally:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.f.close)
+            self.executor.shutdown(wait=False)
+            job_metric("disk", self.write_seconds)
+            count_bytes("down", self.flushed - self.start)
+
+async def stream_to_file(resp, out_path: Path, reporter: ProgressReporter, cancel_event: asyncio.Event = None, hasher=None, offset: int = 0, meta: dict = None, overflow=None):
+    """resp এর বডি out_path এ offset থেকে লেখে; বাতিল বা সাইজ সীমা পেরোলে DownloadAborted তোলে।
+
+    লেখা ও hash হয় FileWriter এর thread এ। meta দিলে meta["done"] কখনো ডিস্কে লেখা বাইটের বেশি হয় না,
+    আর মাঝে মাঝে .part.json এ সেভ হয়; শেষে (ভাঙলেও) জমা buffer লিখে meta["done"] ঠিক করে দেয়।
+    overflow দিলে সাইজ সীমা পেরোলে overflow(resp, out_path, লেখা বাইট, না লেখা chunk) ডেকে VolumeHandoff তোলে।
+    """
     try:
-        size = int(resp.headers.get("Content-Length", 0))
-    except:
+        size = offset + int(resp.headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
         size = 0
-    chunk_size = 256 * 1024
-    try:
-        with out_path.open("wb") as f:
-            async for chunk in resp.content.iter_chunked(chunk_size):
-                if cancel_event and cancel_event.is_set():
-                    return False, "অপারেশন ব্যবহারকারী দ্বারা বাতিল করা হয়েছে।"
-                if not chunk:
-                    break
-                total += len(chunk)
-                if total > MAX_SIZE:
-                    return False, "ফাইলের সাইজ 2GB এর বেশি হতে পারে না।"
-                f.write(chunk)
-                if message and start_time:
-                    await progress_callback(total, size, message, start_time, task=task)
+    if size > MAX_SIZE:
+        if overflow is None:
+            raise DownloadAborted(SIZE_LIMIT_MSG)
+        await reporter.stop()
+        await overflow(resp, out_path, offset, b"")
+        raise VolumeHandoff(SIZE_LIMIT_MSG)
+    if offset:
+        mode = "r+b"
+    elif size:
+        preallocate_file(out_path, size)
+        mode = "r+b"
+    else:
+        mode = "wb"
+    total = offset
+    reporter.update(total, size)
+    writer = FileWriter(out_path, mode, offset, hasher)
+    pending = None
+    try:
+        async for chunk in resp.content.iter_chunked(256 * 1024):
+            if cancel_event and cancel_event.is_set():
+                raise DownloadAborted(CANCEL_MSG)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_SIZE:
+                if overflow is None:
+                    raise DownloadAborted(SIZE_LIMIT_MSG)
+                pending = chunk
+                break
+            await writer.write(chunk)
+            reporter.update(total)
+            if meta is not None:
+                meta["done"] = writer.flushed
+                save_part_meta(out_path, meta)
+        if pending is None:
+            # Content-Length ভুল হলে preallocate করা বাড়তি অংশ কেটে ফেলি
+            await writer.truncate()
+    finally:
+        await writer.close()
+        if meta is not None:
+            meta["done"] = writer.flushed
+    if pending is not None:
+        # সাইজ আগে জানা ছিল না: যা নেমেছে সেটা আর চলমান রেসপন্স দিয়েই অংশে ভাগ, আবার শুরু থেকে নয়
+        await reporter.stop()
+        await overflow(resp, out_path, writer.flushed, pending)
+        raise VolumeHandoff(SIZE_LIMIT_MSG)
+    if size and total != size:
+        raise aiohttp.ClientPayloadError(f"ডাউনলোড অসম্পূর্ণ ({total}/{size} bytes)")
+    return total
+
+async def download_stream(resp, out_path: Path, message: Message = None, start_time=None, task="Downloading", cancel_event: asyncio.Event = None, hasher=None, overflow=None):
+    reporter = ProgressReporter(message if start_time else None, task=task, start_time=start_time)
+    try:
+        async with reporter:
+            await stream_to_file(resp, out_path, reporter, cancel_event, hasher, overflow=overflow)
     except Exception as e:
         return False, str(e)
     return True, None
 
-async def download_url_generic(url: str, out_path: Path, message: Message = None, cancel_event: asyncio.Event = None):
+async def probe_range_support(resp) -> tuple:
+    # Accept-Ranges আর Content-Length দেখে ঠিক করি ফাইলটা ভাগ করে নামানো যাবে কিনা
+    try:
+        size = int(resp.headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
+        size = 0
+    accepts = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+    encoded = resp.headers.get("Content-Encoding", "identity").lower() not in ("", "identity")
+    return size, accepts and size > 0 and not encoded
+
+def part_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + ".part")
+
+def part_meta_path(part: Path) -> Path:
+    return part.with_name(part.name + ".json")
+
+def load_part_meta(part: Path):
+    try:
+        with part_meta_path(part).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_part_meta(part: Path, meta: dict, force: bool = False):
+    # প্রতি chunk এ ডিস্কে লিখি না, কয়েক সেকেন্ড পরপর (বা force হলে সাথে সাথে)
+    now = time.monotonic()
+    if not force and now - meta.get("_saved", 0) < PART_META_INTERVAL:
+        return
+    meta["_saved"] = now
+    target = part_meta_path(part)
+    tmp = target.with_name(target.name + ".tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in meta.items() if not k.startswith("_")}, f)
+        os.replace(tmp, target)
+    except OSError:
+        pass
+
+def drop_part(out_path: Path):
+    part = part_path(out_path)
+    for p in (part, part_meta_path(part)):
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+def response_validators(resp) -> dict:
+    return {
+        "etag": resp.headers.get("ETag", ""),
+        "last_modified": resp.headers.get("Last-Modified", ""),
+    }
+
+def if_range_value(meta: dict) -> str:
+    # weak ETag If-Range এ চলে না, তখন Last-Modified
+    etag = meta.get("etag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return meta.get("last_modified", "")
+
+def content_range_start(resp) -> int:
+    m = re.match(r"bytes (\d+)-", resp.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else -1
+
+def check_status(resp, expected):
+    if resp.status == expected:
+        return
+    if resp.status >= 500 or resp.status in (408, 429):
+        raise RetryableHTTPError(f"HTTP {resp.status}")
+    raise DownloadAborted(f"HTTP {resp.status}")
+
+async def retry_wait(attempt: int, cancel_event: asyncio.Event = None):
+    delay = min(RETRY_BACKOFF * (2 ** attempt), RETRY_BACKOFF_MAX)
+    if cancel_event is None:
+        await asyncio.sleep(delay)
+        return
+    try:
+        await asyncio.wait_for(cancel_event.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        return
+    raise DownloadAborted(CANCEL_MSG)
+
+async def download_segment(sess, url: str, part: Path, seg: list, meta: dict, reporter: ProgressReporter, cancel_event: asyncio.Event = None):
+    # seg = [start, end, done]; done সবসময় ডিস্কে লেখা বাইট, তাই ভাঙলে সেখান থেকেই আবার শুরু
+    attempt = 0
+    while True:
+        start, end, done = seg
+        if start + done > end:
+            return
+        headers = {"Range": f"bytes={start + done}-{end}"}
+        validator = if_range_value(meta)
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            async with sess.get(url, headers=headers, allow_redirects=True) as resp:
+                if resp.status == 200:
+                    raise RestartDownload("সার্ভার Range মানছে না বা ফাইল বদলে গেছে")
+                check_status(resp, 206)
+                if content_range_start(resp) != start + done:
+                    raise RestartDownload("সার্ভার ভুল অংশ পাঠিয়েছে")
+                expected = end - start + 1
+                got = done
+                writer = FileWriter(part, "r+b", start + done)
+                try:
+                    async for chunk in resp.content.iter_chunked(256 * 1024):
+                        if cancel_event and cancel_event.is_set():
+                            raise DownloadAborted(CANCEL_MSG)
+                        if not chunk:
+                            break
+                        chunk = chunk[:expected - got]
+                        await writer.write(chunk)
+                        got += len(chunk)
+                        reporter.add(len(chunk))
+                        seg[2] = writer.flushed - start
+                        save_part_meta(part, meta)
+                        if got >= expected:
+                            break
+                finally:
+                    await writer.close()
+                    seg[2] = writer.flushed - start
+                if seg[2] < expected:
+                    raise aiohttp.ClientPayloadError(f"সেগমেন্ট অসম্পূর্ণ ({seg[2]}/{expected} bytes)")
+                return
+        except RETRYABLE_ERRORS:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            await retry_wait(attempt, cancel_event)
+            attempt += 1
+
+async def download_segmented(sess, url: str, part: Path, meta: dict, reporter: ProgressReporter, cancel_event: asyncio.Event = None):
+    size = meta["size"]
+    if size > MAX_SIZE:
+        raise DownloadAborted(SIZE_LIMIT_MSG)
+    if not meta.get("segments"):
+        # আগে থেকেই পুরো সাইজের ফাইল বানিয়ে রাখি, প্রতিটি সেগমেন্ট নিজের জায়গায় লিখবে
+        preallocate_file(part, size)
+        step = -(-size // meta["segment_count"])
+        meta["segments"] = [[s, min(s + step, size) - 1, 0] for s in range(0, size, step)]
+        save_part_meta(part, meta, force=True)
+    elif file_size(part) != size:
+        raise RestartDownload("আংশিক ফাইলের সাইজ মিলছে না")
+    reporter.update(sum(seg[2] for seg in meta["segments"]), size)
+    tasks = [
+        asyncio.create_task(download_segment(sess, url, part, seg, meta, reporter, cancel_event))
+        for seg in meta["segments"]
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def download_single(sess, url: str, part: Path, meta: dict, segments: int, reporter: ProgressReporter, cancel_event: asyncio.Event = None, hasher=None, overflow=None) -> bool:
+    """এক কানেকশনে .part ফাইলে ডাউনলোড; কানেকশন কাটলে Range দিয়ে যেখানে থেমেছিল সেখান থেকে আবার।
+
+    প্রথম রেসপন্স দেখে segmented মোডে যাওয়া উচিত মনে হলে কিছু না লিখে False ফেরত দেয়।
+    """
+    offset = meta.get("done", 0) if if_range_value(meta) and part.exists() else 0
+    if offset and hasher is not None:
+        # আগের চেষ্টায় নামা অংশের hash আলাদা thread এ মিলিয়ে নিই
+        await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, hash_file, part, hasher, offset)
+    attempt = 0
+    while True:
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = if_range_value(meta)
+        try:
+            async with sess.get(url, headers=headers, allow_redirects=True) as resp:
+                if offset and (resp.status == 416 or (resp.status == 206 and content_range_start(resp) != offset)):
+                    # পুরনো .part এর সাথে সার্ভারের হিসাব মিলছে না: শুরু থেকে আবার
+                    offset = 0
+                    meta.update({"etag": "", "last_modified": "", "done": 0})
+                    if hasher is not None:
+                        hasher.reset()
+                    continue
+                if offset and resp.status == 206:
+                    pass
+                else:
+                    check_status(resp, 200)
+                    if offset:
+                        # সার্ভার Range মানেনি বা ফাইল বদলে গেছে: শুরু থেকে আবার
+                        offset = 0
+                        if hasher is not None:
+                            hasher.reset()
+                    meta.update(response_validators(resp))
+                    meta["done"] = 0
+                    size, ranged = await probe_range_support(resp)
+                    if segments > 1 and ranged and MIN_SEGMENT_SIZE * 2 <= size <= MAX_SIZE:
+                        # এই রেসপন্সের বডি পড়া হবে না, সেগমেন্টগুলো আলাদা Range রিকোয়েস্টে আসবে
+                        meta["size"] = size
+                        meta["segment_count"] = min(segments, size // MIN_SEGMENT_SIZE)
+                        return False
+                await stream_to_file(resp, part, reporter, cancel_event, hasher, offset=offset, meta=meta, overflow=overflow)
+                return True
+        except RETRYABLE_ERRORS:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            offset = meta.get("done", 0) if if_range_value(meta) else 0
+            if not offset and hasher is not None:
+                hasher.reset()
+            save_part_meta(part, meta, force=True)
+            await retry_wait(attempt, cancel_event)
+            attempt += 1
+
+@timed("download")
+async def download_url_generic(url: str, out_path: Path, message: Message = None, cancel_event: asyncio.Event = None, segments: int = None, hasher=None, overflow=None):
+    """URL থেকে out_path এ ডাউনলোড। ডাটা প্রথমে <out_path>.part এ যায়, সফল হলে rename হয়।
+
+    কানেকশন কাটলে DOWNLOAD_RETRIES বার পর্যন্ত backoff দিয়ে Range রিকোয়েস্টে resume করে; ব্যর্থ হলে
+    .part রেখে দেয়, পরে একই out_path এ ডাকলে সেখান থেকেই চলবে। hasher দিলে সেটার reset() থাকতে হবে।
+    """
+    segments = DOWNLOAD_SEGMENTS if segments is None else segments
+    part = part_path(out_path)
+    meta = load_part_meta(part)
+    if not meta or meta.get("url") != url or not part.exists():
+        drop_part(out_path)
+        meta = {"url": url}
+    reporter = ProgressReporter(message, task="Downloading", start_time=datetime.now())
     try:
-        timeout = aiohttp.ClientTimeout(total=3600)
-        headers = {"User-Agent": "Mozilla/5.0"}
-        async with aiohttp.ClientSession(timeout=timeout, headers=headers) as sess:
+        sess = await get_http_session()
+        async with reporter:
+            segmented = False
+            if meta.get("segments"):
+                try:
+                    await download_segmented(sess, url, part, meta, reporter, cancel_event)
+                    segmented = True
+                except RestartDownload:
+                    meta = {"url": url}
+            if not segmented and not await download_single(sess, url, part, meta, segments, reporter, cancel_event, hasher, overflow):
+                try:
+                    await download_segmented(sess, url, part, meta, reporter, cancel_event)
+                    segmented = True
+                except RestartDownload:
+                    # Range এ গোলমাল: একটা কানেকশনে শুরু থেকে
+                    meta = {"url": url}
+                    await download_single(sess, url, part, meta, 1, reporter, cancel_event, hasher, overflow)
+            if segmented and hasher is not None:
+                # সেগমেন্টগুলো এলোমেলো ক্রমে আসে, তাই hash শেষে আলাদা thread এ করি
+                await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, hash_file, part, hasher)
+        os.replace(part, out_path)
+        drop_part(out_path)
+        return True, None
+    except DownloadAborted as e:
+        drop_part(out_path)
+        return False, str(e)
+    except Exception as e:
+        save_part_meta(part, meta, force=True)
+        return False, str(e)
+
+def is_drive_file_response(resp) -> bool:
+    # Content-Disposition থাকলে বা HTML না হলে এটাই আসল ফাইল
+    if "Content-Disposition" in resp.headers:
+        return True
+    return "text/html" not in resp.headers.get("Content-Type", "").lower()
+
+async def read_prefix(resp, limit: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < limit:
+        chunk = await resp.content.read(limit - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+def drive_confirm_target(page: str, file_id: str):
+    """Drive এর "virus scan warning" পেজ থেকে আসল ডাউনলোডের URL আর query বের করে।"""
+    form = re.search(r'<form[^>]*id="download-form"[^>]*>', page)
+    if form:
+        action = re.search(r'action="([^"]+)"', form.group(0))
+        params = {}
+        for tag in re.findall(r'<input[^>]*type="hidden"[^>]*>', page):
+            name = re.search(r'name="([^"]+)"', tag)
+            value = re.search(r'value="([^"]*)"', tag)
+            if name:
+                params[name.group(1)] = html.unescape(value.group(1)) if value else ""
+        if action:
+            params.setdefault("id", file_id)
+            return html.unescape(action.group(1)), params
+    # পুরনো ধরনের পেজ: লিংকের ভেতরে confirm token
+    m = re.search(r"confirm=([0-9A-Za-z_-]+)", page)
+    if m:
+        return DRIVE_DOWNLOAD_URL, {"export": "download", "confirm": m.group(1), "id": file_id}
+    return None, None
+
+@contextlib.asynccontextmanager
+async def drive_file_response(file_id: str):
+    """Drive ফাইলের আসল ডাউনলোড রেসপন্স; বড় ফাইলের confirm পেজ পেরিয়ে। না পেলে DownloadAborted।"""
+    sess = await get_http_session()
+    async with sess.get(DRIVE_DOWNLOAD_URL, params={"export": "download", "id": file_id}, allow_redirects=True) as resp:
+        if resp.status != 200:
+            raise DownloadAborted(f"HTTP {resp.status}")
+        # direct download available: এই রেসপন্সটাই সরাসরি ফাইলে লিখি, দ্বিতীয়বার GET নয়
+        if is_drive_file_response(resp):
+            yield resp
+            return
+        page = (await read_prefix(resp, DRIVE_SNIFF_BYTES)).decode("utf-8", errors="ignore")
+    # confirmation page (large file)
+    target, params = drive_confirm_target(page, file_id)
+    if target:
+        async with sess.get(target, params=params, allow_redirects=True) as resp2:
+            if resp2.status != 200:
+                raise DownloadAborted(f"HTTP {resp2.status}")
+            if is_drive_file_response(resp2):
+                yield resp2
+                return
+    raise DownloadAborted("ডাউনলোডের জন্য Google Drive থেকে অনুমতি প্রয়োজন বা লিংক পাবলিক নয়।")
+
+@timed("download")
+async def download_drive_file(file_id: str, out_path: Path, message: Message = None, cancel_event: asyncio.Event = None, hasher=None, overflow=None):
+    try:
+        async with drive_file_response(file_id) as resp:
+            return await download_stream(resp, out_path, message, datetime.now(), task="Downloading", cancel_event=cancel_event, hasher=hasher, overflow=overflow)
+    except Exception as e:
+        return False, str(e)
+
+def manifest_kind(url: str, content_type: str = ""):
+    """HLS (.m3u8) বা DASH (.mpd) প্লেলিস্ট হলে "hls"/"dash", নাহলে None।"""
+    path = urlsplit(url).path.lower()
+    content_type = (content_type or "").lower()
+    if path.endswith(".m3u8") or "mpegurl" in content_type:
+        return "hls"
+    if path.endswith(".mpd") or "dash+xml" in content_type:
+        return "dash"
+    return None
+
+async def fetch_text(sess, url: str, cancel_event: asyncio.Event = None):
+    """ছোট টেক্সট ফাইল (প্লেলিস্ট) নামায়; redirect এর পরের আসল URL সহ ফেরত দেয়।"""
+    attempt = 0
+    while True:
+        try:
             async with sess.get(url, allow_redirects=True) as resp:
-                if resp.status != 200:
-                    return False, f"HTTP {resp.status}"
-                return await download_stream(resp, out_path, message, datetime.now(), task="Downloading", cancel_event=cancel_event)
+                check_status(resp, 200)
+                data = await read_prefix(resp, MANIFEST_MAX_BYTES)
+                return data.decode("utf-8", errors="replace"), str(resp.url)
+        except RETRYABLE_ERRORS:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            await retry_wait(attempt, cancel_event)
+            attempt += 1
+
+def hls_attrs(line: str) -> dict:
+    return {k: v.strip('"') for k, v in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line.split(":", 1)[-1])}
+
+def hls_pick_variant(text: str, base: str):
+    """master playlist থেকে সবচেয়ে বেশি BANDWIDTH এর variant আর তার আলাদা অডিও (থাকলে)।
+
+    media playlist হলে (None, None)।
+    """
+    lines = [l.strip() for l in text.splitlines()]
+    best = None
+    for i, line in enumerate(lines):
+        if not line.startswith("#EXT-X-STREAM-INF"):
+            continue
+        attrs = hls_attrs(line)
+        uri = next((l for l in lines[i + 1:] if l and not l.startswith("#")), None)
+        bandwidth = int(attrs.get("BANDWIDTH") or 0)
+        if uri and (best is None or bandwidth > best[0]):
+            best = (bandwidth, urljoin(base, uri), attrs.get("AUDIO"))
+    if not best:
+        return None, None
+    audio = None
+    if best[2]:
+        renditions = [hls_attrs(l) for l in lines if l.startswith("#EXT-X-MEDIA")]
+        group = [a for a in renditions if a.get("TYPE") == "AUDIO" and a.get("GROUP-ID") == best[2] and a.get("URI")]
+        if group:
+            chosen = next((a for a in group if a.get("DEFAULT") == "YES"), group[0])
+            audio = urljoin(base, chosen["URI"])
+    return best[1], audio
+
+def hls_media_plan(text: str, base: str, prefix: str):
+    """media playlist এর সব segment/key/init এর তালিকা, আর লোকাল নাম বসানো নতুন playlist।
+
+    তালিকার প্রতিটি উপাদান (url, byte range বা None, লোকাল ফাইলের নাম)।
+    """
+    if "#EXT-X-ENDLIST" not in text:
+        raise DownloadAborted("লাইভ স্ট্রিম সমর্থিত নয় (playlist এ #EXT-X-ENDLIST নেই)।")
+    items = []
+    seen = {}
+    out = []
+    pending_range = None
+    range_end = {}
+
+    def add(url, rng, ext):
+        key = (url, rng)
+        if key not in seen:
+            seen[key] = f"{prefix}{len(items):05d}{ext}"
+            items.append((url, rng, seen[key]))
+        return seen[key]
+
+    for line in (l.strip() for l in text.splitlines()):
+        if not line:
+            continue
+        if line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, start = line.split(":", 1)[1].partition("@")
+            pending_range = (int(length), int(start) if start else None)
+            continue
+        if line.startswith(("#EXT-X-KEY", "#EXT-X-MAP")) and "URI=" in line:
+            attrs = hls_attrs(line)
+            if line.startswith("#EXT-X-KEY") and attrs.get("METHOD") != "AES-128":
+                raise DownloadAborted(f"এনক্রিপশন {attrs.get('METHOD')} সমর্থিত নয়।")
+            rng = None
+            if attrs.get("BYTERANGE"):
+                length, _, start = attrs["BYTERANGE"].partition("@")
+                rng = (int(start or 0), int(start or 0) + int(length) - 1)
+            name = add(urljoin(base, attrs["URI"]), rng, ".key" if line.startswith("#EXT-X-KEY") else ".init")
+            line = re.sub(r',?BYTERANGE="[^"]*"', "", line).replace(f'URI="{attrs["URI"]}"', f'URI="{name}"')
+            out.append(line)
+            continue
+        if line.startswith("#"):
+            out.append(line)
+            continue
+        url = urljoin(base, line)
+        rng = None
+        if pending_range:
+            length, start = pending_range
+            start = range_end.get(url, 0) if start is None else start
+            rng = (start, start + length - 1)
+            range_end[url] = start + length
+            pending_range = None
+        ext = os.path.splitext(urlsplit(url).path)[1][:8] or ".ts"
+        out.append(add(url, rng, ext))
+    return items, "\n".join(out) + "\n"
+
+def dash_duration(value: str) -> float:
+    # ISO 8601, যেমন PT1H2M3.5S
+    m = re.match(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?$", (value or "").strip())
+    if not m:
+        return 0.0
+    days, hours, minutes, seconds = m.groups()
+    return int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+def dash_base(el, base: str) -> str:
+    node = el.find("BaseURL")
+    return urljoin(base, node.text.strip()) if node is not None and node.text else base
+
+def dash_fill(template: str, rep, number: int = None, time_: int = None) -> str:
+    values = {"RepresentationID": rep.get("id", ""), "Bandwidth": rep.get("bandwidth", ""), "Number": number, "Time": time_}
+
+    def sub(m):
+        if not m.group(1):
+            return "$"
+        value = values[m.group(1)]
+        return m.group(2) % int(value) if m.group(2) else str(value)
+
+    return re.sub(r"\$(RepresentationID|Number|Time|Bandwidth|)(%0\d+d)?\$", sub, template)
+
+def dash_range(value: str):
+    if not value:
+        return None
+    start, _, end = value.partition("-")
+    return int(start), int(end)
+
+def dash_segments(aset, rep, base: str, total: float, prefix: str) -> list:
+    """একটি Representation এর init + media segment গুলোর (url, range, লোকাল নাম) তালিকা।"""
+    base = dash_base(rep, base)
+    urls = []
+    templates = [t for t in (aset.find("SegmentTemplate"), rep.find("SegmentTemplate")) if t is not None]
+    seg_list = rep.find("SegmentList")
+    if seg_list is None:
+        seg_list = aset.find("SegmentList")
+    if templates:
+        attrs = {}
+        for t in templates:
+            attrs.update(t.attrib)
+        timeline = next((t.find("SegmentTimeline") for t in reversed(templates) if t.find("SegmentTimeline") is not None), None)
+        if attrs.get("initialization"):
+            urls.append((urljoin(base, dash_fill(attrs["initialization"], rep)), None))
+        media = attrs.get("media", "")
+        number = int(attrs.get("startNumber", 1))
+        timescale = int(attrs.get("timescale", 1))
+        if timeline is not None:
+            t = 0
+            for s in timeline.findall("S"):
+                t = int(s.get("t", t))
+                d = int(s.get("d"))
+                repeat = int(s.get("r", 0))
+                if repeat < 0:
+                    # -1: period শেষ পর্যন্ত একই দৈর্ঘ্যের segment
+                    repeat = max(math.ceil((total * timescale - t) / d) - 1, 0)
+                for _ in range(repeat + 1):
+                    urls.append((urljoin(base, dash_fill(media, rep, number, t)), None))
+                    t += d
+                    number += 1
+        elif attrs.get("duration"):
+            count = math.ceil(total * timescale / int(attrs["duration"]))
+            for n in range(number, number + count):
+                urls.append((urljoin(base, dash_fill(media, rep, n)), None))
+    elif seg_list is not None:
+        init = seg_list.find("Initialization")
+        if init is not None:
+            urls.append((urljoin(base, init.get("sourceURL", "")), dash_range(init.get("range"))))
+        for seg in seg_list.findall("SegmentURL"):
+            urls.append((urljoin(base, seg.get("media", "")), dash_range(seg.get("mediaRange"))))
+    else:
+        # SegmentBase বা শুধু BaseURL: পুরো track একটাই ফাইল
+        urls.append((base, None))
+    return [(url, rng, f"{prefix}{i:05d}.m4s") for i, (url, rng) in enumerate(urls)]
+
+def dash_plan(text: str, base: str) -> list:
+    """MPD থেকে সবচেয়ে ভালো ভিডিও ও অডিও track এর segment তালিকা (প্রথম Period)।"""
+    root = ET.fromstring(text)
+    for el in root.iter():
+        el.tag = el.tag.rsplit("}", 1)[-1]
+    if root.get("type") == "dynamic":
+        raise DownloadAborted("লাইভ স্ট্রিম সমর্থিত নয় (MPD type=dynamic)।")
+    period = root.find("Period")
+    if period is None:
+        raise DownloadAborted("MPD তে কোনো Period নেই।")
+    total = dash_duration(period.get("duration") or root.get("mediaPresentationDuration"))
+    base = dash_base(period, dash_base(root, base))
+    best = {}
+    for aset in period.findall("AdaptationSet"):
+        for rep in aset.findall("Representation"):
+            mime = rep.get("mimeType") or aset.get("mimeType") or ""
+            kind = aset.get("contentType") or mime.split("/")[0]
+            bandwidth = int(rep.get("bandwidth") or 0)
+            if kind in ("video", "audio") and (kind not in best or bandwidth > best[kind][0]):
+                best[kind] = (bandwidth, aset, rep)
+    tracks = []
+    for kind in ("video", "audio"):
+        if kind in best:
+            _, aset, rep = best[kind]
+            tracks.append(dash_segments(aset, rep, dash_base(aset, base), total, f"t{len(tracks)}_"))
+    if not tracks:
+        raise DownloadAborted("MPD তে কোনো ভিডিও/অডিও track পাওয়া যায়নি।")
+    return tracks
+
+async def fetch_segment(sess, url: str, rng, path: Path, progress, cancel_event: asyncio.Event = None):
+    # আগের চেষ্টায় পুরো নামা segment আবার নামাই না; অসম্পূর্ণটা .tmp এ থাকে
+    if path.exists():
+        progress(file_size(path), True)
+        return
+    tmp = path.with_name(path.name + ".tmp")
+    headers = {"Range": f"bytes={rng[0]}-{rng[1]}"} if rng else {}
+    attempt = 0
+    while True:
+        got = 0
+        try:
+            async with sess.get(url, headers=headers, allow_redirects=True) as resp:
+                check_status(resp, 206 if rng else 200)
+                writer = FileWriter(tmp, "wb")
+                try:
+                    async for chunk in resp.content.iter_chunked(256 * 1024):
+                        if cancel_event and cancel_event.is_set():
+                            raise DownloadAborted(CANCEL_MSG)
+                        await writer.write(chunk)
+                        got += len(chunk)
+                        progress(len(chunk), False)
+                finally:
+                    await writer.close()
+            os.replace(tmp, path)
+            progress(0, True)
+            return
+        except RETRYABLE_ERRORS:
+            progress(-got, False)
+            if attempt >= DOWNLOAD_RETRIES:
+                raise
+            await retry_wait(attempt, cancel_event)
+            attempt += 1
+
+async def fetch_segments(sess, items: list, seg_dir: Path, reporter: ProgressReporter, cancel_event: asyncio.Event = None):
+    """সব segment SEGMENT_WORKERS টি করে একসাথে নামায়; মোট সাইজ আগের segment গুলোর গড় থেকে আন্দাজ করা।"""
+    state = {"bytes": 0, "done": 0}
+
+    def progress(n, finished):
+        state["bytes"] += n
+        state["done"] += finished
+        if state["bytes"] > MAX_SIZE:
+            raise DownloadAborted(SIZE_LIMIT_MSG)
+        estimate = state["bytes"] * len(items) // state["done"] if state["done"] else 0
+        reporter.update(state["bytes"], max(estimate, state["bytes"]))
+
+    slots = asyncio.Semaphore(SEGMENT_WORKERS)
+
+    async def one(url, rng, name):
+        async with slots:
+            await fetch_segment(sess, url, rng, seg_dir / name, progress, cancel_event)
+
+    tasks = [asyncio.create_task(one(*item)) for item in items]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def concat_files(paths: list, out_path: Path):
+    with out_path.open("wb") as out:
+        for p in paths:
+            with p.open("rb") as f:
+                shutil.copyfileobj(f, out, 4 * 1024 * 1024)
+
+@timed("download")
+async def download_manifest(url: str, kind: str, out_path: Path, seg_dir: Path, message: Message = None, cancel_event: asyncio.Event = None):
+    """HLS/DASH এর segment গুলো seg_dir এ একসাথে নামিয়ে ffmpeg -c copy দিয়ে out_path (.mp4) বানায়।
+
+    ভাঙলে seg_dir রেখে দেয়, পরে একই seg_dir দিয়ে ডাকলে শুধু বাকি segment নামে।
+    """
+    reporter = ProgressReporter(message, task="Downloading", start_time=datetime.now())
+    loop = asyncio.get_running_loop()
+    try:
+        sess = await get_http_session()
+        text, base = await fetch_text(sess, url, cancel_event)
+        seg_dir.mkdir(parents=True, exist_ok=True)
+        inputs = []
+        items = []
+        if kind == "hls":
+            video_url, audio_url = hls_pick_variant(text, base)
+            playlists = [(text, base)] if not video_url else [await fetch_text(sess, video_url, cancel_event)]
+            if audio_url:
+                playlists.append(await fetch_text(sess, audio_url, cancel_event))
+            for i, (pl_text, pl_base) in enumerate(playlists):
+                pl_items, local = hls_media_plan(pl_text, pl_base, f"t{i}_")
+                local_path = seg_dir / f"t{i}.m3u8"
+                local_path.write_text(local, encoding="utf-8")
+                items += pl_items
+                inputs += ["-allowed_extensions", "ALL", "-protocol_whitelist", "file,crypto,data", "-i", str(local_path)]
+        else:
+            tracks = dash_plan(text, base)
+            for track in tracks:
+                items += track
+        if not items:
+            raise DownloadAborted("playlist এ কোনো segment নেই।")
+        async with reporter:
+            await fetch_segments(sess, items, seg_dir, reporter, cancel_event)
+        if kind == "dash":
+            # fMP4: init + media segment গুলো পরপর জোড়া দিলেই একটা চলনসই track
+            for i, track in enumerate(tracks):
+                track_path = seg_dir / f"t{i}.mp4"
+                await loop.run_in_executor(PROBE_EXECUTOR, concat_files, [seg_dir / name for _, _, name in track], track_path)
+                inputs += ["-i", str(track_path)]
+        maps = ["-map", "0:v?", "-map", "1:a?"] if inputs.count("-i") > 1 else []
+        rc = await run_ffmpeg(["-y", "-loglevel", "error", *inputs, *maps, "-c", "copy", "-movflags", "+faststart", str(out_path)], timeout=MERGE_TIMEOUT)
+        if rc != 0 or not out_path.exists():
+            return False, "ffmpeg দিয়ে segment গুলো জোড়া লাগানো যায়নি।"
+        shutil.rmtree(seg_dir, ignore_errors=True)
+        return True, None
+    except DownloadAborted as e:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+        return False, str(e)
+    except ET.ParseError as e:
+        return False, f"MPD পড়া যায়নি: {e}"
     except Exception as e:
         return False, str(e)
 
-async def download_drive_file(file_id: str, out_path: Path, message: Message = None, cancel_event: asyncio.Event = None):
-    base = f"https://drive.google.com/uc?export=download&id={file_id}"
-    try:
-        timeout = aiohttp.ClientTimeout(total=3600)
-        headers = {"User-Agent": "Mozilla/5.0"}
-        async with aiohttp.ClientSession(timeout=timeout, headers=headers) as sess:
-            async with sess.get(base, allow_redirects=True) as resp:
-                text = await resp.text(errors="ignore")
-                # direct download available
-                if "content-disposition" in (k.lower() for k in resp.headers.keys()):
-                    async with sess.get(base) as r2:
-                        return await download_stream(r2, out_path, message, datetime.now(), task="Downloading", cancel_event=cancel_event)
-                # confirmation token (large file)
-                m = re.search(r"confirm=([0-9A-Za-z_-]+)", text)
-                if m:
-                    token = m.group(1)
-                    download_url = f"https://drive.google.com/uc?export=download&confirm={token}&id={file_id}"
-                    async with sess.get(download_url, allow_redirects=True) as resp2:
-                        if resp2.status != 200:
-                            return False, f"HTTP {resp2.status}"
-                        return await download_stream(resp2, out_path, message, datetime.now(), task="Downloading", cancel_event=cancel_event)
-                return False, "ডাউনলোডের জন্য Google Drive থেকে অনুমতি প্রয়োজন বা লিংক পাবলিক নয়।"
+@contextlib.asynccontextmanager
+async def url_response(url: str):
+    sess = await get_http_session()
+    async with sess.get(url, allow_redirects=True) as resp:
+        check_status(resp, 200)
+        yield resp
+
+def stream_duration(prefix: bytes, ext: str) -> float:
+    """ফাইলের শুরুর অংশ থেকে ভিডিওর দৈর্ঘ্য (সেকেন্ড); pipe দিয়ে পড়া না গেলে বা না পেলে 0।"""
+    if ext in (".mp4", ".mov"):
+        # moov যদি mdat এর আগে থাকে (faststart) তবেই ffmpeg stdin থেকে পড়তে পারে
+        pos = 0
+        while pos + 8 <= len(prefix):
+            size, kind = struct.unpack(">I4s", prefix[pos:pos + 8])
+            if size == 1 and pos + 16 <= len(prefix):
+                size = struct.unpack(">Q", prefix[pos + 8:pos + 16])[0]
+            if kind == b"moov":
+                i = prefix.find(b"mvhd", pos)
+                if i < 0 or i + 5 > len(prefix) or i + (36 if prefix[i + 4] == 1 else 24) > len(prefix):
+                    return 0.0
+                if prefix[i + 4] == 1:
+                    timescale, duration = struct.unpack(">IQ", prefix[i + 24:i + 36])
+                else:
+                    timescale, duration = struct.unpack(">II", prefix[i + 16:i + 24])
+                return duration / timescale if timescale else 0.0
+            if kind == b"mdat" or size < 8:
+                return 0.0
+            pos += size
+        return 0.0
+    if ext in (".mkv", ".webm"):
+        # Matroska: Segment Info এর Duration (float) আর TimecodeScale (ডিফল্ট 1ms)
+        i = prefix.find(b"\x44\x89")
+        if i < 0 or i + 3 > len(prefix) or prefix[i + 2] not in (0x84, 0x88):
+            return 0.0
+        fmt = ">d" if prefix[i + 2] == 0x88 else ">f"
+        length = struct.calcsize(fmt)
+        if i + 3 + length > len(prefix):
+            return 0.0
+        duration = struct.unpack(fmt, prefix[i + 3:i + 3 + length])[0]
+        scale = 1000000
+        j = prefix.find(b"\x2a\xd7\xb1")
+        if j >= 0 and j + 4 <= len(prefix) and 0x81 <= prefix[j + 3] <= 0x88:
+            n = prefix[j + 3] & 0x0f
+            scale = int.from_bytes(prefix[j + 4:j + 4 + n], "big") or scale
+        return duration * scale / 1e9
+    return 0.0
+
+async def file_chunks(path: Path, length: int, chunk_size: int = 4 * 1024 * 1024):
+    loop = asyncio.get_running_loop()
+    with path.open("rb") as f:
+        while length > 0:
+            block = await loop.run_in_executor(PROBE_EXECUTOR, f.read, min(chunk_size, length))
+            if not block:
+                raise RuntimeError(f"{path.name} এ যত বাইট থাকার কথা ছিল তত নেই")
+            length -= len(block)
+            yield block
+
+async def resumable_chunks(resp, start: int, cancel_event: asyncio.Event = None):
+    """resp এর বডি; কানেকশন কাটলে DOWNLOAD_RETRIES বার পর্যন্ত backoff দিয়ে resp.url এ Range রিকোয়েস্টে resume করে।
+
+    start হলো resp এর পরের বাইটটা ফাইলের কোন জায়গার। ETag/Last-Modified না থাকলে বা সার্ভার Range না মানলে
+    (ততক্ষণে আগের অংশ আপলোড হয়ে গেছে, শুরু থেকে নামানো যায় না) ত্রুটিটাই তোলে।
+    """
+    sess = await get_http_session()
+    url = str(resp.url)
+    validator = if_range_value(response_validators(resp))
+    try:
+        end = start + int(resp.headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
+        end = 0
+    if end == start:
+        end = 0
+    pos = start
+    attempt = 0
+    current = resp
+    while True:
+        try:
+            if current is None:
+                headers = {"Range": f"bytes={pos}-", "If-Range": validator}
+                opener = sess.get(url, headers=headers, allow_redirects=True)
+            else:
+                opener = contextlib.nullcontext(current)
+            async with opener as r:
+                if r is not current:
+                    check_status(r, 206)
+                    if content_range_start(r) != pos:
+                        raise DownloadAborted("সার্ভার ভুল অংশ পাঠিয়েছে, resume করা যায়নি")
+                current = None
+                async for chunk in r.content.iter_chunked(256 * 1024):
+                    pos += len(chunk)
+                    attempt = 0
+                    yield chunk
+            if end and pos < end:
+                raise aiohttp.ClientPayloadError(f"ডাউনলোড অসম্পূর্ণ ({pos}/{end} bytes)")
+            return
+        except RETRYABLE_ERRORS:
+            current = None
+            if not validator or attempt >= DOWNLOAD_RETRIES:
+                raise
+            await retry_wait(attempt, cancel_event)
+            attempt += 1
+
+async def upload_volume(c: Client, m: Message, path: Path):
+    size = file_size(path)
+    if size > MAX_SIZE:
+        raise RuntimeError(f"{path.name} এর সাইজ 2GB এর বেশি হয়ে গেছে")
+    async with UPLOAD_SLOTS:
+        if path.suffix.lower() in VIDEO_EXTS:
+            info = await probe_media(path)
+            thumb = user_thumb(m.from_user.id) or await video_thumbnail(path)
+            await UPLOAD_POOL.send(
+                c, "send_video",
+                chat_id=m.chat.id,
+                size=size,
+                video=str(path),
+                caption=path.name,
+                file_name=path.name,
+                thumb=thumb,
+                duration=info.get("duration", 0),
+                width=info.get("width", 0),
+                height=info.get("height", 0),
+            )
+        else:
+            await UPLOAD_POOL.send(
+                c, "send_document",
+                chat_id=m.chat.id,
+                size=size,
+                document=str(path),
+                file_name=path.name,
+                caption=path.name,
+            )
+
+def copy_range(src: Path, dst: Path, start: int, length: int, chunk_size: int = 4 * 1024 * 1024):
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        fin.seek(start)
+        while length > 0:
+            block = fin.read(min(chunk_size, length))
+            if not block:
+                break
+            fout.write(block)
+            length -= len(block)
+
+async def upload_volume_pieces(c: Client, m: Message, path: Path) -> int:
+    """MAX_SIZE পেরোনো segment (VBR এ keyframe দেরিতে এলে হয়) বাইট ভাগ করে একটা একটা করে আপলোড; অংশের সংখ্যা ফেরত দেয়।"""
+    size = file_size(path)
+    count = 0
+    for start in range(0, size, VOLUME_SIZE):
+        count += 1
+        piece = path.with_name(f"{path.name}.{count:03d}")
+        await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, copy_range, path, piece, start, VOLUME_SIZE)
+        try:
+            await upload_volume(c, m, piece)
+        finally:
+            try:
+                piece.unlink()
+            except OSError:
+                pass
+    return count
+
+async def split_and_upload(c: Client, job, resp, name: str, vol_dir: Path, head: Path = None, head_len: int = 0, pending: bytes = b"") -> int:
+    """resp এর বডি VOLUME_SIZE এর অংশে ভাগ করে; একটি অংশ আপলোড হতে হতেই পরেরটা নামে।
+
+    ভিডিও (faststart mp4 বা mkv/webm, আর ffmpeg থাকলে) ffmpeg segment দিয়ে keyframe এ কাটা হয়,
+    নাহলে সরাসরি বাইট ভাগ (.001, .002 ...)। আপলোড হওয়া অংশ সাথে সাথে মুছে যায়, আর VOLUME_KEEP
+    টির বেশি শেষ হওয়া অংশ ডিস্কে জমলে নেটওয়ার্ক থেকে পড়া থেমে থাকে। আপলোড হওয়া অংশের সংখ্যা ফেরত দেয়।
+
+    ডাউনলোড মাঝপথে হাতবদল হলে head এর প্রথম head_len বাইট আর pending (পড়া হয়েছে, লেখা হয়নি) আগে যায়,
+    তারপর resp এর বাকিটা; তখন বাইট ভাগই হয়। কানেকশন কাটলে resumable_chunks Range দিয়ে চালিয়ে নেয়।
+    """
+    cancel_event = job.cancel_event
+    try:
+        size = int(resp.headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
+        size = 0
+    if size:
+        size += head_len + len(pending)
+    ready = asyncio.Queue()
+    state = {"pending": 0, "uploaded": 0, "error": None}
+    changed = asyncio.Event()
+
+    async def uploader():
+        while True:
+            path = await ready.get()
+            if path is None:
+                return
+            try:
+                if state["error"] is None:
+                    reporter.task = f"Downloading (অংশ {path.name} আপলোড হচ্ছে)"
+                    if file_size(path) > MAX_SIZE:
+                        state["uploaded"] += await upload_volume_pieces(c, job.m, path)
+                    else:
+                        await upload_volume(c, job.m, path)
+                        state["uploaded"] += 1
+            except Exception as e:
+                state["error"] = e
+            finally:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                state["pending"] -= 1
+                changed.set()
+
+    def check():
+        if cancel_event.is_set():
+            raise DownloadAborted(CANCEL_MSG)
+        if state["error"] is not None:
+            raise state["error"]
+
+    async def wait_for_room():
+        # শেষ হওয়া কিন্তু আপলোড না হওয়া অংশ VOLUME_KEEP টি হলে আপলোডের অপেক্ষা
+        while state["pending"] >= VOLUME_KEEP:
+            check()
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+        check()
+
+    def part_done(path: Path):
+        state["pending"] += 1
+        ready.put_nowait(path)
+
+    stem, ext = os.path.splitext(name)
+    ext = ext.lower()
+    prefix = b""
+    segment_time = 0
+    if VOLUME_MODE != "raw" and ext in VIDEO_EXTS and size and not head_len and not pending and shutil.which("ffmpeg"):
+        prefix = await read_prefix(resp, VOLUME_SNIFF_BYTES)
+        duration = stream_duration(prefix, ext)
+        if duration:
+            # বিটরেট ওঠানামা করে, তাই VOLUME_MARGIN দিয়ে একটু ছোট অংশ ধরি
+            segment_time = max(1, int(duration * VOLUME_SIZE / size * VOLUME_MARGIN))
+
+    async def body():
+        if head_len:
+            async for block in file_chunks(head, head_len):
+                yield block
+            # সব বাইট অংশে চলে গেছে, বড় .part ফাইলটা আর রাখার দরকার নেই
+            head.unlink()
+        if pending:
+            yield pending
+        if prefix:
+            yield prefix
+        async with contextlib.aclosing(resumable_chunks(resp, head_len + len(pending) + len(prefix), cancel_event)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    reporter = ProgressReporter(job.status_msg, task="Downloading", total=size)
+    upload_task = asyncio.create_task(uploader())
+    received = 0
+    try:
+        async with reporter:
+            if segment_time:
+                out_ext = ".mkv" if ext in (".mkv", ".webm") else ".mp4"
+                list_path = vol_dir / "segments.txt"
+                maps = ["-map", "0"] if out_ext == ".mkv" else ["-map", "0:v", "-map", "0:a?"]
+                fmt_opts = ["-segment_format_options", "movflags=+faststart"] if out_ext == ".mp4" else []
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+                    *maps, "-c", "copy", "-f", "segment", "-segment_time", str(segment_time),
+                    "-reset_timestamps", "1", "-segment_list", str(list_path), "-segment_list_type", "flat",
+                    *fmt_opts, str(vol_dir / f"{stem}.part%03d{out_ext}"),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                seen = set()
+
+                def collect():
+                    # ffmpeg প্রতিটি segment শেষ হলে তবেই তালিকায় নাম লেখে
+                    try:
+                        names = list_path.read_text(encoding="utf-8").split()
+                    except OSError:
+                        return
+                    for n in names:
+                        if n not in seen:
+                            seen.add(n)
+                            part_done(vol_dir / n)
+
+                try:
+                    async with contextlib.aclosing(body()) as chunks:
+                        async for chunk in chunks:
+                            received += len(chunk)
+                            reporter.update(received)
+                            collect()
+                            await wait_for_room()
+                            proc.stdin.write(chunk)
+                            await proc.stdin.drain()
+                    proc.stdin.close()
+                    rc = await asyncio.wait_for(proc.wait(), timeout=MERGE_TIMEOUT)
+                except BaseException:
+                    if proc.returncode is None:
+                        proc.kill()
+                        await proc.wait()
+                    raise
+                if rc != 0:
+                    raise RuntimeError("ffmpeg দিয়ে ভিডিও ভাগ করা যায়নি।")
+                collect()
+            else:
+                index = 0
+                written = 0
+                writer = None
+                part = None
+                try:
+                    async with contextlib.aclosing(body()) as chunks:
+                        async for chunk in chunks:
+                            received += len(chunk)
+                            reporter.update(received)
+                            while chunk:
+                                if writer is None:
+                                    await wait_for_room()
+                                    index += 1
+                                    part = vol_dir / f"{name}.{index:03d}"
+                                    writer = FileWriter(part, "wb")
+                                    written = 0
+                                take = chunk[:VOLUME_SIZE - written]
+                                chunk = chunk[len(take):]
+                                await writer.write(take)
+                                written += len(take)
+                                if written >= VOLUME_SIZE:
+                                    await writer.close()
+                                    writer = None
+                                    part_done(part)
+                            check()
+                    if writer is not None:
+                        await writer.close()
+                        writer = None
+                        part_done(part)
+                finally:
+                    if writer is not None:
+                        await writer.close()
+            if size and received != size:
+                raise aiohttp.ClientPayloadError(f"ডাউনলোড অসম্পূর্ণ ({received}/{size} bytes)")
+            ready.put_nowait(None)
+            await upload_task
+            check()
+    finally:
+        if not upload_task.done():
+            upload_task.cancel()
+            await asyncio.gather(upload_task, return_exceptions=True)
+    return state["uploaded"]
+
+async def run_volume_job(c: Client, job, url: str, name: str, resp=None, head: Path = None, head_len: int = 0, pending: bytes = b""):
+    """MAX_SIZE এর বড় ফাইল: ডিস্কে VOLUME_KEEP টি অংশের জায়গা রেখে ভাগ করে আপলোড।
+
+    resp দিলে (ডাউনলোড মাঝপথে সাইজ সীমা পেরোলে) নতুন রিকোয়েস্ট না করে সেটাই আর head/pending ব্যবহার হয়।
+    """
+    status_msg = job.status_msg
+    cancel_event = job.cancel_event
+    vol_dir = TMP / f"vol_{job.uid}_{job.id}"
+    vol_dir.mkdir(parents=True, exist_ok=True)
+    job.paths.add(str(vol_dir))
+    need = VOLUME_SIZE * VOLUME_KEEP
+    if not workspace_fits(need):
+        job.status = "waiting_disk"
+        await status_msg.edit("ডিস্কে জায়গা খালি হওয়ার অপেক্ষায়...", reply_markup=progress_keyboard())
+    if not await reserve_workspace(vol_dir, need, cancel_event=cancel_event):
+        shutil.rmtree(vol_dir, ignore_errors=True)
+        await status_msg.edit("ডিস্কে যথেষ্ট জায়গা নেই, কাজটি বাতিল করা হয়েছে।", reply_markup=None)
+        finish_job(job, "cancelled" if cancel_event.is_set() else "failed")
+        return None
+    job.status = "splitting"
+    await status_msg.edit("ফাইল 2GB এর বড়, অংশে ভাগ করে আপলোড হবে...", reply_markup=progress_keyboard())
+    try:
+        if resp is not None:
+            opener = contextlib.nullcontext(resp)
+        elif is_drive_url(url):
+            opener = drive_file_response(extract_drive_id(url))
+        else:
+            opener = url_response(url)
+        with phase_timer("volume"):
+            async with opener as resp:
+                count = await split_and_upload(c, job, resp, name, vol_dir, head, head_len, pending)
+        await status_msg.edit(f"আপলোড সম্পন্ন ({count}টি অংশে)।", reply_markup=None)
+        finish_job(job, "done")
+    except Exception as e:
+        await status_msg.edit(f"ভাগ করে আপলোড ব্যর্থ: {e}", reply_markup=None)
+        finish_job(job, "cancelled" if cancel_event.is_set() else "failed")
+    finally:
+        release_workspace(vol_dir)
+        shutil.rmtree(vol_dir, ignore_errors=True)
+    return None
+
+def can_stream_upload(name: str) -> bool:
+    # ভিডিওর thumbnail/duration বের করতে পুরো ফাইল লাগে, তাই শুধু পরিচিত non-video এক্সটেনশন স্ট্রিম হবে
+    ext = Path(name).suffix.lower()
+    return bool(ext) and ext not in VIDEO_EXTS and mimetypes.guess_type(name)[0] is not None
+
+async def upload_stream_parts(c: Client, queue: asyncio.Queue, file_id: int, total_parts: int, reporter: ProgressReporter, state: dict):
+    is_big = total_parts * STREAM_PART_SIZE > BIG_FILE_THRESHOLD
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        if "error" in state:
+            # অন্য worker ব্যর্থ হয়েছে; producer যাতে আটকে না যায় তাই বাকি part শুধু খালি করে যাই
+            continue
+        index, data = item
+        try:
+            for attempt in range(3):
+                try:
+                    if is_big:
+                        done = await c.invoke(raw.functions.upload.SaveBigFilePart(
+                            file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=data))
+                    else:
+                        done = await c.invoke(raw.functions.upload.SaveFilePart(
+                            file_id=file_id, file_part=index, bytes=data))
+                    if done:
+                        break
+                except FloodWait as e:
+                    wait = getattr(e, "value", None) or getattr(e, "x", 5)
+                    job_metric("floodwait", wait)
+                    await asyncio.sleep(wait)
+            else:
+                raise RuntimeError(f"part {index} আপলোড হয়নি")
+            reporter.add(len(data))
+        except Exception as e:
+            state["error"] = e
+
+@timed("stream")
+async def stream_url_to_telegram(c: Client, m: Message, url: str, name: str, status_msg: Message, cancel_event: asyncio.Event = None, cache_keys=None):
+    """URL থেকে পড়া বাইট সরাসরি Telegram upload part হিসেবে পাঠায়, ডিস্কে কিছু লেখে না।
+
+    সাইজ জানা না গেলে (বা 2GB এর বেশি হলে) কিছু না পড়েই None ফেরত দেয়, তখন সাধারণ দুই-ধাপের পথে যেতে হবে।
+    কানেকশন কাটলে resumable_chunks Range দিয়ে চালিয়ে নেয়; তা না গেলে আর কোনো part পাঠানো না হয়ে থাকলে
+    তখনও None (দুই-ধাপের পথে .part resume আছে)।
+    """
+    sess = await get_http_session()
+    async with sess.get(url, allow_redirects=True) as resp:
+        if resp.status != 200:
+            return None
+        size, _ = await probe_range_support(resp)
+        encoded = resp.headers.get("Content-Encoding", "identity").lower() not in ("", "identity")
+        if not size or encoded or size > MAX_SIZE:
+            return None
+
+        file_id = c.rnd_id()
+        total_parts = math.ceil(size / STREAM_PART_SIZE)
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER_PARTS)
+        state = {}
+        hasher = hashlib.sha256()
+        reporter = ProgressReporter(status_msg, task="Downloading + Uploading", total=size)
+        index = 0
+        workers = [
+            asyncio.create_task(upload_stream_parts(c, queue, file_id, total_parts, reporter, state))
+            for _ in range(STREAM_UPLOAD_WORKERS)
+        ]
+        try:
+            async with reporter:
+                buf = bytearray()
+                received = 0
+                async with contextlib.aclosing(resumable_chunks(resp, 0, cancel_event)) as chunks:
+                    async for chunk in chunks:
+                        if cancel_event and cancel_event.is_set():
+                            raise DownloadAborted(CANCEL_MSG)
+                        if "error" in state:
+                            raise state["error"]
+                        received += len(chunk)
+                        if received > size:
+                            raise RuntimeError("সার্ভার Content-Length এর চেয়ে বেশি ডাটা পাঠিয়েছে।")
+                        buf += chunk
+                        hasher.update(chunk)
+                        while len(buf) >= STREAM_PART_SIZE:
+                            await queue.put((index, bytes(buf[:STREAM_PART_SIZE])))
+                            del buf[:STREAM_PART_SIZE]
+                            index += 1
+                if received != size:
+                    raise RuntimeError(f"ডাউনলোড অসম্পূর্ণ ({received}/{size} bytes)")
+                if buf:
+                    await queue.put((index, bytes(buf)))
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+                if "error" in state:
+                    raise state["error"]
+        except Exception as e:
+            for t in workers:
+                t.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if isinstance(e, RETRYABLE_ERRORS) and index == 0:
+                return None
+            return False, str(e)
+    count_bytes("down", size)
+    count_bytes("up", size)
+
+    if size > BIG_FILE_THRESHOLD:
+        input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=name)
+    else:
+        input_file = raw.types.InputFile(id=file_id, parts=total_parts, name=name, md5_checksum="")
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        file=input_file,
+        attributes=[raw.types.DocumentAttributeFilename(file_name=name)],
+    )
+    try:
+        r = await c.invoke(raw.functions.messages.SendMedia(
+            peer=await c.resolve_peer(m.chat.id),
+            media=media,
+            message=name,
+            random_id=c.rnd_id(),
+        ))
+        for update in getattr(r, "updates", []):
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                sent = await types.Message._parse(
+                    c, update.message,
+                    {u.id: u for u in r.users},
+                    {ch.id: ch for ch in r.chats},
+                )
+                keys = list(cache_keys or []) + [f"sha256:{hasher.hexdigest()}"]
+                cache_store(keys, message_file_id(sent), False, name)
+                break
     except Exception as e:
         return False, str(e)
+    return True, None
 
 async def set_bot_commands():
     cmds = [
@@ -161,6 +2097,10 @@ async def set_bot_commands():
         BotCommand("view_thumb", "আপনার থাম্বনেইল দেখুন (admin only)"),
         BotCommand("del_thumb", "আপনার থাম্বনেইল মুছে ফেলুন (admin only)"),
         BotCommand("rename", "reply করা ভিডিও রিনেম করুন (admin only)"),
+        BotCommand("queue", "কিউতে থাকা কাজগুলো দেখুন (admin only)"),
+        BotCommand("cancel", "ID দিয়ে কাজ বাতিল করুন (admin only)"),
+        BotCommand("pool", "আপলোড session গুলোর অবস্থা (admin only)"),
+        BotCommand("stats", "ডাউনলোড/আপলোডের সময় ও গতির হিসাব (admin only)"),
         BotCommand("broadcast", "ব্রডকাস্ট (কেবল অ্যাডমিন)"),
         BotCommand("help", "সহায়িকা")
     ]
@@ -176,11 +2116,16 @@ async def start_handler(c, m: Message):
         "Hi! আমি URL uploader bot.\n\n"
         "নোট: এই বটের সব কার্য (upload/rename/setthumb ইত্যাদি) শুধুমাত্র বট অ্যাডমিন (owner) চালাতে পারবে।\n\n"
         "Commands:\n"
-        "/upload_url <url> - URL থেকে ডাউনলোড ও Telegram-এ আপলোড (admin only)\n"
+        "/upload_url <url> [url2 ...] - URL থেকে ডাউনলোড ও Telegram-এ আপলোড, .m3u8/.mpd ও চলবে (admin only)\n"
         "/setthumb - একটি ছবি পাঠান, সেট হবে আপনার থাম্বনেইল (admin only)\n"
         "/view_thumb - আপনার থাম্বনেইল দেখুন (admin only)\n"
         "/del_thumb - আপনার থাম্বনেইল মুছে ফেলুন (admin only)\n"
-        "/rename <newname.ext> - reply করা ভিডিও রিনেম করুন (admin only)\n"
+        "/rename <newname.ext> - reply করা ভিডিও রিনেম করুন, শুধু caption বদলায় (admin only)\n"
+        "/rename -f <newname.ext> - ফাইলের নিজের নামও বদলে আবার আপলোড (admin only)\n"
+        "/queue - কিউতে থাকা কাজগুলো দেখুন (admin only)\n"
+        "/cancel <id> - নির্দিষ্ট কাজ বাতিল করুন (admin only)\n"
+        "/pool - আপলোড session গুলোর গতি ও FloodWait দেখুন (admin only)\n"
+        "/stats - কোন ধাপে কত সময় লাগছে (p50/p95) ও দৈনিক ডাটা (admin only)\n"
         "/broadcast <text> - ব্রডকাস্ট (শুধুমাত্র অ্যাডমিন)\n"
         "/help - সাহায্য"
     )
@@ -203,15 +2148,10 @@ async def photo_handler(c, m: Message):
     if not is_admin(m.from_user.id):
         return
     uid = m.from_user.id
-    out = TMP / f"thumb_{uid}.jpg"
+    out = THUMB_DIR / f"thumb_{uid}.jpg"
     try:
         await m.download(file_name=str(out))
-        img = Image.open(out)
-        img.thumbnail((320, 320))
-        img = img.convert("RGB")
-        img.save(out, "JPEG")
-        if out.exists() and out.stat().st_size > 0:
-            USER_THUMBS[uid] = str(out)
+        if await store_user_thumb(uid, out):
             await m.reply_text("আপনার থাম্বনেইল সেভ হয়েছে।")
         else:
             await m.reply_text("থাম্বনেইল সেভ হয়নি, আবার চেষ্টা করুন।")
@@ -243,159 +2183,811 @@ async def del_thumb_cmd(c, m: Message):
         except Exception:
             pass
         USER_THUMBS.pop(uid, None)
+        USER_THUMB_DATA.pop(uid, None)
+        journal_touch()
         await m.reply_text("আপনার থাম্বনেইল মুছে ফেলা হয়েছে।")
     else:
         await m.reply_text("আপনার কোনো থাম্বনেইল সেভ করা নেই।")
 
+def prepare_thumb(path: Path) -> bytes:
+    # Telegram এর থাম্বনেইল: সর্বোচ্চ 320px, JPEG
+    img = Image.open(path)
+    img.thumbnail((320, 320))
+    img = img.convert("RGB")
+    img.save(path, "JPEG")
+    return path.read_bytes()
+
+async def store_user_thumb(uid: int, path: Path) -> bool:
+    data = await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, prepare_thumb, path)
+    if not data:
+        return False
+    USER_THUMBS[uid] = str(path)
+    USER_THUMB_DATA[uid] = data
+    journal_touch()
+    return True
+
+def user_thumb(uid: int):
+    """ইউজারের কাস্টম থাম্বনেইল, নতুন BytesIO হিসেবে (প্রতিটি আপলোড নিজেরটা পড়ে)।"""
+    data = USER_THUMB_DATA.get(uid)
+    if data is None:
+        path = USER_THUMBS.get(uid)
+        if not path or not Path(path).exists():
+            return None
+        # রিস্টার্টের পর journal থেকে আসা থাম্বনেইল, সেভের সময়ই প্রস্তুত করা হয়েছিল
+        data = USER_THUMB_DATA[uid] = Path(path).read_bytes()
+    thumb = io.BytesIO(data)
+    thumb.name = f"thumb_{uid}.jpg"
+    return thumb
+
+def content_fingerprint(path: Path) -> str:
+    """সাইজ আর শুরু/মাঝ/শেষের THUMB_SAMPLE বাইটের sha256; পুরো ফাইল পড়তে হয় না।"""
+    size = path.stat().st_size
+    h = hashlib.sha256(str(size).encode())
+    with path.open("rb") as f:
+        for offset in (0, size // 2, max(size - THUMB_SAMPLE, 0)):
+            f.seek(offset)
+            h.update(f.read(THUMB_SAMPLE))
+    return h.hexdigest()
+
+def prune_thumb_cache():
+    files = [p for p in THUMB_CACHE_DIR.glob("*.jpg") if not p.name.endswith(".part.jpg")]
+    if len(files) <= THUMB_CACHE_MAX:
+        return
+    files.sort(key=lambda p: p.stat().st_mtime)
+    for p in files[:len(files) - THUMB_CACHE_MAX]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+async def video_thumbnail(video_path: Path):
+    """ভিডিওর থাম্বনেইল; একই কনটেন্টের জন্য আগে বানানো থাকলে ffmpeg চালানো হয় না।"""
+    try:
+        key = await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, content_fingerprint, video_path)
+    except OSError:
+        return None
+    cached = THUMB_CACHE_DIR / f"{key[:32]}.jpg"
+    if cached.exists():
+        os.utime(cached)
+        return str(cached)
+    tmp = THUMB_CACHE_DIR / f"{key[:32]}.{id(video_path)}.part.jpg"
+    if await generate_video_thumbnail(video_path, tmp):
+        os.replace(tmp, cached)
+        prune_thumb_cache()
+        return str(cached)
+    try:
+        tmp.unlink()
+    except OSError:
+        pass
+    return None
+
+@timed("thumbnail")
 async def generate_video_thumbnail(video_path: Path, thumb_path: Path):
     try:
-        duration = get_video_duration(video_path)
-        timestamp = 1 if duration > 1 else 0
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-i", str(video_path),
-            "-ss", str(timestamp),
-            "-vframes", "1",
-            "-vf", "scale=320:-1",
-            str(thumb_path)
-        ]
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return thumb_path.exists() and thumb_path.stat().st_size > 0
+        duration = (await probe_media(video_path))["duration"]
+        timestamp = duration * THUMB_POSITION if duration > 1 else 0
+        # -i এর আগে -ss: শুরু থেকে decode না করে সরাসরি seek; nokey: শুধু keyframe decode
+        for skip in (["-skip_frame", "nokey"], []):
+            args = [
+                "-y", "-loglevel", "error",
+                *skip,
+                "-ss", f"{timestamp:.3f}",
+                "-i", str(video_path),
+                "-frames:v", "1",
+                "-vf", "scale=320:-1",
+                "-q:v", "3",
+                str(thumb_path)
+            ]
+            await run_ffmpeg(args, timeout=FFMPEG_TIMEOUT)
+            if thumb_path.exists() and thumb_path.stat().st_size > 0:
+                return True
+        return False
     except Exception as e:
         print(f"Thumbnail generate error: {e}")
         return False
 
-async def upload_progress(current, total, message: Message, start_time):
-    await progress_callback(current, total, message, start_time, task="Uploading")
+async def upload_progress(current, total, reporter: ProgressReporter):
+    # pyrogram প্রতি part এ এটা ডাকে; এখানে কোনো Telegram কল নেই
+    reporter.update(current, total)
+
+class UploadSession:
+    """আপলোডের একটি Telegram session (মূল বট বা বাড়তি বট) ও তার হিসাব।"""
+
+    def __init__(self, name: str, client: Client, is_main: bool = False):
+        self.name = name
+        self.client = client
+        self.is_main = is_main
+        self.flood_until = 0.0  # time.monotonic() এর এই সময় পর্যন্ত এই session এ আপলোড নয়
+        self.active = 0
+        self.uploads = 0
+        self.floods = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.peers = {}  # chat_id -> এই বট সেখানে পাঠাতে পারে কিনা (resolve_peer এর ফল)
+
+    def ready(self) -> bool:
+        return time.monotonic() >= self.flood_until
+
+    def speed(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def describe(self) -> str:
+        wait = self.flood_until - time.monotonic()
+        state = f"বিরতি {int(wait)}s" if wait > 0 else f"active {self.active}"
+        return (
+            f"{self.name}: {state}, {self.uploads} upload, "
+            f"{self.bytes / (1024 * 1024):.1f} MB, {self.speed() / (1024 * 1024):.2f} MB/s, flood {self.floods}, error {self.errors}"
+        )
+
+class UploadPool:
+    """একাধিক বট session এ পুরো আপলোড ভাগ করে দেয়; FloodWait পাওয়া session কিছুক্ষণ বাদ থাকে।"""
+
+    def __init__(self):
+        self.sessions = []
+
+    def add(self, name: str, client: Client, is_main: bool = False):
+        self.sessions.append(UploadSession(name, client, is_main))
+
+    async def start(self):
+        for s in self.sessions:
+            if s.is_main:
+                continue
+            try:
+                await s.client.start()
+            except Exception as e:
+                print(f"Upload session {s.name} চালু হয়নি:", e)
+                s.flood_until = float("inf")
+
+    async def stop(self):
+        for s in self.sessions:
+            if not s.is_main and s.client.is_connected:
+                try:
+                    await s.client.stop()
+                except Exception:
+                    pass
+
+    def pick(self, target: int) -> UploadSession:
+        # প্রস্তুত session গুলোর মধ্যে যেটাতে কম আপলোড চলছে; সবাই FloodWait এ থাকলে যেটা আগে ছাড়া পাবে।
+        # যে বাড়তি বট target এ পৌঁছাতে পারে না সেটা বাদ
+        usable = [s for s in self.sessions if s.is_main or s.peers.get(target) is not False]
+        ready = [s for s in usable if s.ready()]
+        if ready:
+            return min(ready, key=lambda s: (s.active, not s.is_main))
+        return min(usable, key=lambda s: s.flood_until)
+
+    async def reachable(self, s: UploadSession, target: int) -> bool:
+        # pyrogram পুরো ফাইল আপলোডের পরে peer খোঁজে, তাই আগেই দেখে নিই (session প্রতি একবার)
+        if target not in s.peers:
+            try:
+                await s.client.resolve_peer(target)
+                s.peers[target] = True
+            except FloodWait:
+                raise
+            except Exception as e:
+                print(f"Upload session {s.name}: {target} এ পাঠানো যাবে না ({e})")
+                s.peers[target] = False
+        return s.peers[target]
+
+    async def send(self, c: Client, method: str, chat_id: int, size: int = 0, **kwargs):
+        """send_video/send_document চালায়। ফেরত দেওয়া Message এর file_id মূল বট ব্যবহার করতে না পারলে None।"""
+        # বাড়তি বট ইউজারকে সরাসরি পাঠাতে পারলেও, channel থাকলে সেখানে দিয়ে মূল বট কপি করে
+        target = UPLOAD_CHANNEL_ID or chat_id
+        while True:
+            s = self.pick(target)
+            if s.flood_until == float("inf"):
+                raise RuntimeError("কোনো upload session চালু নেই")
+            wait = s.flood_until - time.monotonic()
+            if wait > 0:
+                job_metric("floodwait", wait)
+                await asyncio.sleep(wait)
+            try:
+                if not s.is_main and not await self.reachable(s, target):
+                    continue
+            except FloodWait as e:
+                s.floods += 1
+                s.flood_until = time.monotonic() + e.value
+                continue
+            via_channel = not s.is_main and UPLOAD_CHANNEL_ID
+            s.active += 1
+            started = time.monotonic()
+            try:
+                client = c if s.is_main else s.client
+                sent = await getattr(client, method)(chat_id=UPLOAD_CHANNEL_ID if via_channel else chat_id, **kwargs)
+            except FloodWait as e:
+                s.floods += 1
+                s.flood_until = time.monotonic() + e.value
+                print(f"Upload session {s.name}: FloodWait {e.value}s, অন্য session এ চেষ্টা")
+                continue
+            except Exception as e:
+                if s.is_main:
+                    raise
+                # peer ঠিক থাকলেও অন্য কোনো ত্রুটি: কিছুক্ষণ বাদ রেখে অন্য session এ
+                s.errors += 1
+                s.flood_until = time.monotonic() + UPLOAD_SESSION_BENCH
+                print(f"Upload session {s.name}: {e}, {int(UPLOAD_SESSION_BENCH)}s বাদ রাখা হলো")
+                continue
+            finally:
+                s.active -= 1
+            s.uploads += 1
+            s.bytes += size
+            s.seconds += time.monotonic() - started
+            job_metric("upload", time.monotonic() - started)
+            count_bytes("up", size)
+            if s.is_main:
+                return sent
+            if via_channel:
+                return await c.copy_message(chat_id, UPLOAD_CHANNEL_ID, sent.id)
+            return None
+
+    def describe(self) -> str:
+        return "\n".join(s.describe() for s in self.sessions)
+
+UPLOAD_POOL = UploadPool()
+UPLOAD_POOL.add("main", app, is_main=True)
+for i, token in enumerate(UPLOAD_BOT_TOKENS, 1):
+    # বাড়তি বটগুলো শুধু আপলোড করে, কোনো update/কমান্ড নেয় না
+    UPLOAD_POOL.add(f"uploader_{i}", Client(f"uploader_{i}", api_id=API_ID, api_hash=API_HASH, bot_token=token, no_updates=True))
 
-async def process_file_and_upload(c: Client, m: Message, in_path: Path, original_name: str = None):
+async def process_file_and_upload(c: Client, m: Message, in_path: Path, original_name: str = None, job: "Job" = None, cache_keys=None):
     uid = m.from_user.id
-    cancel_event = TASKS.get(uid)
+    cancel_event = job.cancel_event if job else None
     if cancel_event and cancel_event.is_set():
-        await m.reply_text("অপারেশন বাতিল করা হয়েছে, আপলোড শুরু করা হয়নি।")
-        TASKS.pop(uid, None)
+        await m.reply_text("অপারেশন বাতিল করা হয়েছে, আপলোড শুরু করা হয়নি।")
         return
     try:
         final_name = original_name or in_path.name
-        thumb_path = USER_THUMBS.get(uid)
-        if thumb_path and not Path(thumb_path).exists():
-            thumb_path = None
+        thumb = user_thumb(uid)
 
-        is_video = in_path.suffix.lower() in {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm"}
+        is_video = in_path.suffix.lower() in VIDEO_EXTS
 
-        if is_video and not thumb_path:
-            thumb_path_tmp = TMP / f"thumb_{uid}_{int(datetime.now().timestamp())}.jpg"
-            ok = await generate_video_thumbnail(in_path, thumb_path_tmp)
-            if ok:
-                thumb_path = str(thumb_path_tmp)
+        if is_video and not thumb:
+            thumb = await video_thumbnail(in_path)
 
         status_msg = await m.reply_text("আপলোড শুরু হচ্ছে...", reply_markup=progress_keyboard())
-        cancel_event = TASKS.get(uid)
-        if cancel_event and cancel_event.is_set():
-            await status_msg.edit("অপারেশন বাতিল করা হয়েছে, আপলোড শুরু হয়নি।", reply_markup=None)
-            TASKS.pop(uid, None)
-            return
-        start_time = datetime.now()
+        if job:
+            job.status = "waiting_upload"
+        # একসাথে কয়টি আপলোড চলবে তা UPLOAD_SLOTS ঠিক করে; ডাউনলোড worker গুলো এতে আটকায় না
+        waited = time.monotonic()
+        async with UPLOAD_SLOTS:
+            job_metric("upload_wait", time.monotonic() - waited)
+            if cancel_event and cancel_event.is_set():
+                await status_msg.edit("অপারেশন বাতিল করা হয়েছে, আপলোড শুরু হয়নি।", reply_markup=None)
+                return
+            if job:
+                job.status = "uploading"
+            start_time = datetime.now()
+            reporter = ProgressReporter(status_msg, task="Uploading", start_time=start_time)
 
-        duration_sec = get_video_duration(in_path) if in_path.exists() else 0
+            media_info = await probe_media(in_path) if is_video else {}
 
-        try:
-            if is_video:
-                await c.send_video(
-                    chat_id=m.chat.id,
-                    video=str(in_path),
-                    caption=final_name,
-                    thumb=thumb_path,
-                    duration=duration_sec,
-                    progress=upload_progress,
-                    progress_args=(status_msg, start_time)
-                )
-            else:
-                await c.send_document(
-                    chat_id=m.chat.id,
-                    document=str(in_path),
-                    file_name=final_name,
-                    caption=final_name,
-                    progress=upload_progress,
-                    progress_args=(status_msg, start_time)
-                )
-            await status_msg.edit("আপলোড সম্পন্ন।", reply_markup=None)
-            LAST_FILE[uid] = {"path": str(in_path), "name": final_name, "is_video": is_video, "thumb": thumb_path}
-        except Exception as e:
-            await status_msg.edit(f"আপলোড ব্যর্থ: {e}", reply_markup=None)
-        finally:
-            TASKS.pop(uid, None)
+            try:
+                # reporter শুধু এই block এর শেষে (সফল বা ব্যর্থ) একবার থামে, তার পরে শেষ edit
+                async with reporter:
+                    size = file_size(in_path)
+                    if is_video:
+                        sent = await UPLOAD_POOL.send(
+                            c, "send_video",
+                            chat_id=m.chat.id,
+                            size=size,
+                            video=str(in_path),
+                            caption=final_name,
+                            file_name=final_name,
+                            thumb=thumb,
+                            duration=media_info.get("duration", 0),
+                            width=media_info.get("width", 0),
+                            height=media_info.get("height", 0),
+                            progress=upload_progress,
+                            progress_args=(reporter,)
+                        )
+                    else:
+                        sent = await UPLOAD_POOL.send(
+                            c, "send_document",
+                            chat_id=m.chat.id,
+                            size=size,
+                            document=str(in_path),
+                            file_name=final_name,
+                            caption=final_name,
+                            progress=upload_progress,
+                            progress_args=(reporter,)
+                        )
+                await status_msg.edit("আপলোড সম্পন্ন।", reply_markup=None)
+                remember_last_file(uid, {"path": str(in_path), "name": final_name, "is_video": is_video})
+                if sent:
+                    cache_store(cache_keys, message_file_id(sent), is_video, final_name)
+                if job:
+                    job.status = "done"
+            except Exception as e:
+                await status_msg.edit(f"আপলোড ব্যর্থ: {e}", reply_markup=None)
     except Exception as e:
-        TASKS.pop(uid, None)
         await m.reply_text(f"আপলোডে ত্রুটি: {e}")
 
+class Job:
+    """কিউতে থাকা একটি কাজ; প্রতিটি job এর নিজস্ব cancel event থাকে।"""
+
+    def __init__(self, m: Message, url: str = None, kind: str = "url", job_id: int = None):
+        self.id = job_id or new_job_id()
+        self.uid = m.from_user.id
+        self.m = m
+        self.url = url
+        self.kind = kind
+        self.cancel_event = asyncio.Event()
+        self._status = "queued"
+        self.status_msg = None
+        self.upload_task = None
+        self.media_msg = None  # rename job: যে ফাইলটা আবার আপলোড হবে
+        self.paths = set()  # এই job এর TMP ফাইল; sweep এগুলো মুছবে না
+        self.out_path = None
+        self.name = None
+        self.cache_keys = []
+        self.bytes_done = 0
+        self.created = datetime.now()
+        self.metrics = {}  # phase -> সেকেন্ড, আর down_bytes/up_bytes
+        self.http = {}  # প্রথম রিকোয়েস্টের dns/connect/ttfb
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str):
+        self._status = value
+        journal_touch()
+
+    def to_record(self) -> dict:
+        return {
+            "id": self.id,
+            "uid": self.uid,
+            "chat_id": self.m.chat.id,
+            "message_id": self.m.id,
+            "url": self.url,
+            "kind": self.kind,
+            "phase": self.status,
+            "out_path": self.out_path,
+            "name": self.name,
+            "cache_keys": self.cache_keys,
+            "bytes_done": self.bytes_done,
+            "status_msg_id": self.status_msg.id if self.status_msg else None,
+            "media_msg_id": self.media_msg.id if self.media_msg else None,
+        }
+
+    def describe(self) -> str:
+        target = self.url or (f"{self.kind}: {self.name}" if self.name else self.kind)
+        if len(target) > 50:
+            target = target[:47] + "..."
+        line = f"#{self.id} [{self.status}] {target}"
+        if self.http:
+            line += " (" + ", ".join(f"{stage} {value * 1000:.0f} ms" for stage, value in self.http.items()) + ")"
+        return line
+
+def new_job_id() -> int:
+    global LAST_JOB_ID
+    LAST_JOB_ID += 1
+    return LAST_JOB_ID
+
+def register_job(job: Job) -> Job:
+    JOBS[job.id] = job
+    journal_touch()
+    return job
+
+def finish_job(job: Job, status: str = None):
+    if status:
+        job.status = status
+    if JOBS.pop(job.id, None) is not None:
+        record_job_stats(job)
+    journal_touch()
+
+def journal_touch():
+    global JOURNAL_DIRTY
+    JOURNAL_DIRTY = True
+
+def journal_save():
+    """চলমান job আর থাম্বনেইলের তালিকা JOURNAL_PATH এ atomic ভাবে লিখে রাখে।"""
+    global JOURNAL_DIRTY
+    JOURNAL_DIRTY = False
+    data = {
+        "last_id": LAST_JOB_ID,
+        "thumbs": {str(uid): path for uid, path in USER_THUMBS.items()},
+        "jobs": [job.to_record() for job in sorted(JOBS.values(), key=lambda j: j.id)],
+    }
+    tmp = JOURNAL_PATH.with_name(JOURNAL_PATH.name + ".tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, JOURNAL_PATH)
+    except OSError as e:
+        JOURNAL_DIRTY = True
+        print("Journal save error:", e)
+
+async def journal_flusher():
+    while True:
+        await asyncio.sleep(JOURNAL_INTERVAL)
+        # bytes_done প্রতি chunk এ বদলায়, তাই চলমান job থাকলে নিয়মিত লিখি
+        if JOURNAL_DIRTY or JOBS:
+            journal_save()
+
+async def restore_journal(c: Client):
+    """রিস্টার্টের পর journal থেকে থাম্বনেইল ফেরত আনে আর অসমাপ্ত job আবার চালু করে।"""
+    global LAST_JOB_ID
+    try:
+        with JOURNAL_PATH.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    for uid, path in data.get("thumbs", {}).items():
+        if Path(path).exists():
+            USER_THUMBS[int(uid)] = path
+    LAST_JOB_ID = max(LAST_JOB_ID, data.get("last_id", 0))
+    for rec in data.get("jobs", []):
+        try:
+            await resume_job_record(c, rec)
+        except Exception:
+            traceback.print_exc()
+    journal_save()
+
+async def resume_job_record(c: Client, rec: dict):
+    m = await c.get_messages(rec["chat_id"], rec["message_id"])
+    if not m or m.empty:
+        return
+    media_msg = None
+    if rec["kind"] == "rename":
+        if rec.get("media_msg_id"):
+            media_msg = await c.get_messages(rec["chat_id"], rec["media_msg_id"])
+        else:
+            media_msg = m.reply_to_message
+        if not media_msg or media_msg.empty or not rec.get("name"):
+            if rec.get("status_msg_id"):
+                # ফাইলটা আর নেই: পুরনো বার্তার Cancel বাটন যেন ঝুলে না থাকে
+                try:
+                    await c.edit_message_text(rec["chat_id"], rec["status_msg_id"], "বট রিস্টার্টের পর ফাইলটা আর পাওয়া যায়নি, কাজটি বাতিল।")
+                except Exception:
+                    pass
+            return
+    elif rec["kind"] != "url" or not rec.get("url"):
+        return
+    job = register_job(Job(m, url=rec.get("url"), kind=rec["kind"], job_id=rec["id"]))
+    job.bytes_done = rec.get("bytes_done", 0)
+    status_msg = None
+    if rec.get("status_msg_id"):
+        status_msg = await c.get_messages(rec["chat_id"], rec["status_msg_id"])
+    if status_msg and not status_msg.empty:
+        job.status_msg = status_msg
+    else:
+        job.status_msg = await m.reply_text(f"job #{job.id} আবার চালু হচ্ছে...")
+    out_path = Path(rec["out_path"]) if rec.get("out_path") else None
+    if out_path:
+        job.paths |= {str(out_path), str(part_path(out_path)), str(part_meta_path(part_path(out_path)))}
+    if media_msg is not None:
+        # /rename -f: Telegram থেকে আবার নেওয়া সস্তা, তাই শুরু থেকে কিউতে
+        job.media_msg = media_msg
+        job.name = rec["name"]
+    elif rec["phase"] in ("waiting_upload", "uploading") and out_path and out_path.exists():
+        # ডাউনলোড আগেই শেষ হয়েছিল, শুধু আপলোড বাকি
+        job.out_path, job.name, job.cache_keys = str(out_path), rec.get("name"), rec.get("cache_keys") or []
+        await job.status_msg.edit(f"বট রিস্টার্ট হয়েছে, job #{job.id} এর আপলোড আবার শুরু হচ্ছে...", reply_markup=None)
+        token = CURRENT_JOB.set(job)
+        try:
+            job.upload_task = asyncio.create_task(upload_url_job(c, job, out_path, job.name or out_path.name, cache_keys=job.cache_keys))
+        finally:
+            CURRENT_JOB.reset(token)
+        return
+    # বাকি সব কিউতে; .part থাকলে ডাউনলোড সেখান থেকেই চলবে
+    job.status = "queued"
+    await job.status_msg.edit(
+        f"বট রিস্টার্ট হয়েছে, job #{job.id} আবার কিউতে রাখা হলো।",
+        reply_markup=progress_keyboard(job.id)
+    )
+    await JOB_QUEUE.put(job)
+
+def extract_urls(text: str) -> list:
+    # বাক্যের ভেতরের লিংকের শেষে লেগে থাকা যতিচিহ্ন/বন্ধনী বাদ
+    return [u.rstrip(".,;:!?)]>\"'") for u in URL_RE.findall(text)]
+
 @app.on_message(filters.command("upload_url") & filters.private)
 async def upload_url_cmd(c, m: Message):
     if not is_admin(m.from_user.id):
         await m.reply_text("আপনার অনুমতি নেই এই কমান্ড চালানোর।")
         return
-    if not m.command or len(m.command) < 2:
-        await m.reply_text("ব্যবহার: /upload_url <url>\nউদাহরণ: /upload_url https://example.com/file.mp4")
+    urls = extract_urls(m.text.split(None, 1)[1]) if m.command and len(m.command) >= 2 else []
+    if not urls:
+        await m.reply_text("ব্যবহার: /upload_url <url> [url2 ...]\nউদাহরণ: /upload_url https://example.com/file.mp4")
         return
-    url = m.text.split(None, 1)[1].strip()
-    await handle_url_download_and_upload(c, m, url)
+    await enqueue_urls(c, m, urls)
+
+async def enqueue_urls(c: Client, m: Message, urls: list):
+    # এক মেসেজে কয়েকটি লিংক: প্রতিটি আলাদা job, নিজের Cancel বাটনসহ
+    if len(urls) > BATCH_MAX_URLS:
+        await m.reply_text(f"এক মেসেজে সর্বোচ্চ {BATCH_MAX_URLS}টি লিংক নেওয়া হয়, বাকিগুলো বাদ দেওয়া হলো।")
+    for url in urls[:BATCH_MAX_URLS]:
+        await handle_url_download_and_upload(c, m, url)
 
 async def handle_url_download_and_upload(c: Client, m: Message, url: str):
-    uid = m.from_user.id
-    if uid in TASKS:
-        await m.reply_text("একই সময়ে শুধু একটাই কাজ করা যাবে। দয়া করে শেষ হওয়া পর্যন্ত অপেক্ষা করুন।")
-        return
+    # সরাসরি কাজ না করে কিউতে রাখি; download worker গুলো ক্রমানুসারে তুলে নেবে
+    job = register_job(Job(m, url=url))
+    position = JOB_QUEUE.qsize() + 1
+    job.status_msg = await m.reply_text(
+        f"কিউতে যোগ হয়েছে (job #{job.id}, অবস্থান {position})।",
+        reply_markup=progress_keyboard(job.id)
+    )
+    await JOB_QUEUE.put(job)
+    return job
 
-    status_msg = await m.reply_text("ডাউনলোড শুরু হচ্ছে...", reply_markup=progress_keyboard())
-    cancel_event = asyncio.Event()
-    TASKS[uid] = cancel_event
+async def run_url_job(c: Client, job: Job):
+    """Job এর ডাউনলোড অংশ চালায়; সফল হলে আপলোড অংশের coroutine ফেরত দেয়।"""
+    m = job.m
+    uid = job.uid
+    url = job.url
+    status_msg = job.status_msg
+    cancel_event = job.cancel_event
+    job.status = "downloading"
+    await status_msg.edit("ডাউনলোড শুরু হচ্ছে...", reply_markup=progress_keyboard())
 
+    tmp_in = None
     try:
         fname = url.split("/")[-1].split("?")[0] or f"download_{int(datetime.now().timestamp())}"
         safe_name = re.sub(r"[\\/*?\"<>|:]", "_", fname)
 
-        video_exts = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm"}
-        if not any(safe_name.lower().endswith(ext) for ext in video_exts):
+        # একই URL (একই ETag/সাইজ) আগে আপলোড হয়ে থাকলে Telegram এর file_id দিয়েই আবার পাঠাই
+        info = None if is_drive_url(url) else await head_info(url)
+        url_key = url_cache_key(url, info)
+        if await send_from_cache(c, m, url_key):
+            await status_msg.edit("আগে আপলোড হওয়া ফাইল, ক্যাশ থেকে পাঠানো হয়েছে।", reply_markup=None)
+            finish_job(job, "done")
+            return None
+
+        kind = None if is_drive_url(url) else manifest_kind(url, info["type"] if info else "")
+        if kind:
+            # playlist নিজে নয়, segment গুলো জোড়া লাগিয়ে .mp4 আপলোড হবে
+            safe_name = os.path.splitext(safe_name)[0] + ".mp4"
+
+        if not kind and info and info["length"].isdigit() and int(info["length"]) > MAX_SIZE:
+            return await run_volume_job(c, job, url, safe_name)
+
+        if STREAM_UPLOAD and not kind and not is_drive_url(url) and can_stream_upload(safe_name):
+            # ভিডিও নয় এমন ফাইল: ডিস্কে না রেখে ডাউনলোডের সাথে সাথেই আপলোড
+            job.status = "streaming"
+            async with UPLOAD_SLOTS:
+                res = await stream_url_to_telegram(c, m, url, safe_name, status_msg, cancel_event=cancel_event, cache_keys=[url_key])
+            if res is not None:
+                ok, err = res
+                if ok:
+                    await status_msg.edit("আপলোড সম্পন্ন।", reply_markup=None)
+                    finish_job(job, "done")
+                else:
+                    await status_msg.edit(f"ডাউনলোড/আপলোড ব্যর্থ: {err}", reply_markup=None)
+                    finish_job(job, "cancelled" if cancel_event.is_set() else "failed")
+                return None
+            job.status = "downloading"
+
+        volume_name = safe_name
+        if not any(safe_name.lower().endswith(ext) for ext in VIDEO_EXTS):
             # if extension unknown, default to .mp4
             safe_name += ".mp4"
 
-        tmp_in = TMP / f"dl_{uid}_{int(datetime.now().timestamp())}_{safe_name}"
+        # একই URL এর জন্য একই নাম, যাতে আগের ব্যর্থ চেষ্টার .part থেকে resume হয়
+        url_tag = hashlib.sha1(normalize_url(url).encode()).hexdigest()[:12]
+        tmp_in = TMP / f"dl_{uid}_{url_tag}_{safe_name}"
+        if any(str(tmp_in) in other.paths for other in JOBS.values() if other is not job):
+            tmp_in = TMP / f"dl_{uid}_{url_tag}_{job.id}_{safe_name}"
+        tmp_part = part_path(tmp_in)
+        job.paths |= {str(tmp_in), str(tmp_part), str(part_meta_path(tmp_part))}
+        job.out_path = str(tmp_in)
+        job.name = safe_name
+        size = int(info["length"]) if info and info["length"].isdigit() and not kind else 0
+        if size and not workspace_fits(size):
+            job.status = "waiting_disk"
+            await status_msg.edit("ডিস্কে জায়গা খালি হওয়ার অপেক্ষায়...", reply_markup=progress_keyboard())
+        if size and not await reserve_workspace(tmp_in, size, cancel_event=cancel_event):
+            await status_msg.edit("ডিস্কে যথেষ্ট জায়গা নেই, কাজটি বাতিল করা হয়েছে।", reply_markup=None)
+            finish_job(job, "cancelled" if cancel_event.is_set() else "failed")
+            return None
+        job.status = "downloading"
         ok, err = False, None
-        if is_drive_url(url):
+        hasher = StreamHash("sha256")
+        handed_off = []
+
+        async def overflow(resp, head, head_len, pending):
+            handed_off.append(True)
+            await run_volume_job(c, job, url, volume_name, resp, head, head_len, pending)
+        seg_dir = TMP / f"{kind}_{uid}_{url_tag}" if kind else None
+        if seg_dir and any(str(seg_dir) in other.paths for other in JOBS.values() if other is not job):
+            seg_dir = TMP / f"{kind}_{uid}_{url_tag}_{job.id}"
+        if kind:
+            job.paths.add(str(seg_dir))
+            ok, err = await download_manifest(url, kind, tmp_in, seg_dir, status_msg, cancel_event=cancel_event)
+            if ok:
+                await asyncio.get_running_loop().run_in_executor(PROBE_EXECUTOR, hash_file, tmp_in, hasher)
+        elif is_drive_url(url):
             fid = extract_drive_id(url)
             if not fid:
-                await status_msg.edit("Google Drive লিঙ্ক থেকে file id পাওয়া যায়নি। সঠিক লিংক দিন।", reply_markup=None)
-                TASKS.pop(uid, None)
-                return
-            ok, err = await download_drive_file(fid, tmp_in, status_msg, cancel_event=cancel_event)
+                await status_msg.edit("Google Drive লিঙ্ক থেকে file id পাওয়া যায়নি। সঠিক লিংক দিন।", reply_markup=None)
+                finish_job(job, "failed")
+                return None
+            ok, err = await download_drive_file(fid, tmp_in, status_msg, cancel_event=cancel_event, hasher=hasher, overflow=overflow)
         else:
-            ok, err = await download_url_generic(url, tmp_in, status_msg, cancel_event=cancel_event)
+            ok, err = await download_url_generic(url, tmp_in, status_msg, cancel_event=cancel_event, hasher=hasher, overflow=overflow)
+
+        if handed_off:
+            # HEAD এ সাইজ জানা যায়নি, ডাউনলোডের সময় ধরা পড়েছে: run_volume_job বাকিটা করে job শেষ করেছে
+            cleanup_download(uid, tmp_in)
+            return None
+        if not ok and err == SIZE_LIMIT_MSG and not kind and not cancel_event.is_set():
+            # ডাউনলোড শুরুর আগেই সাইজ ধরা পড়েছে (segmented মোড), কিছু নামেনি: অংশে ভাগ করে নতুন করে
+            cleanup_download(uid, tmp_in)
+            return await run_volume_job(c, job, url, volume_name)
 
         if not ok:
-            await status_msg.edit(f"ডাউনলোড ব্যর্থ: {err}", reply_markup=None)
-            if tmp_in.exists():
-                try:
-                    tmp_in.unlink()
-                except:
-                    pass
-            TASKS.pop(uid, None)
-            return
+            resumable = tmp_part.exists() or (seg_dir is not None and seg_dir.exists())
+            hint = "\n(একই লিংক আবার পাঠালে যেখানে থেমেছে সেখান থেকে শুরু হবে)" if resumable else ""
+            await status_msg.edit(f"ডাউনলোড ব্যর্থ: {err}{hint}", reply_markup=None)
+            cleanup_download(uid, tmp_in)
+            finish_job(job, "cancelled" if cancel_event.is_set() else "failed")
+            return None
+
+        # অন্য URL থেকে হলেও একই কনটেন্ট আগে আপলোড হয়ে থাকলে আর আপলোড করি না
+        sha_key = f"sha256:{hasher.hexdigest()}"
+        hit = await send_from_cache(c, m, sha_key, caption=safe_name)
+        if hit:
+            cache_store([url_key], hit["file_id"], hit["is_video"], safe_name)
+            await status_msg.edit("একই ফাইল আগে আপলোড হয়েছিল, ক্যাশ থেকে পাঠানো হয়েছে।", reply_markup=None)
+            cleanup_download(uid, tmp_in)
+            finish_job(job, "done")
+            return None
 
         await status_msg.edit("ডাউনলোড সম্পন্ন, Telegram-এ আপলোড হচ্ছে...", reply_markup=None)
-        await process_file_and_upload(c, m, tmp_in, original_name=safe_name)
+        job.cache_keys = [url_key, sha_key]
+        job.status = "waiting_upload"
+        return upload_url_job(c, job, tmp_in, safe_name, cache_keys=job.cache_keys)
+    except Exception as e:
+        traceback.print_exc()
+        await status_msg.edit(f"অপস! কিছু ভুল হয়েছে: {e}", reply_markup=None)
+        cleanup_download(uid, tmp_in)
+        finish_job(job, "failed")
+        return None
+
+async def upload_url_job(c: Client, job: Job, tmp_in: Path, safe_name: str, cache_keys=None):
+    try:
+        await process_file_and_upload(c, job.m, tmp_in, original_name=safe_name, job=job, cache_keys=cache_keys)
     except Exception as e:
         traceback.print_exc()
-        await status_msg.edit(f"অপস! কিছু ভুল হয়েছে: {e}", reply_markup=None)
-        TASKS.pop(uid, None)
+        await job.status_msg.edit(f"অপস! কিছু ভুল হয়েছে: {e}", reply_markup=None)
     finally:
-        # try to cleanup if file remains and not stored in LAST_FILE
+        cleanup_download(job.uid, tmp_in)
+        finish_job(job, job.status if job.status == "done" else ("cancelled" if job.cancel_event.is_set() else "failed"))
+
+def cleanup_download(uid: int, tmp_in: Path):
+    # try to cleanup if file remains and not stored in LAST_FILE
+    if tmp_in:
+        release_workspace(tmp_in)
+    try:
+        if tmp_in and LAST_FILE.get(uid, {}).get("path") != str(tmp_in):
+            if tmp_in.exists():
+                tmp_in.unlink()
+    except Exception:
+        pass
+
+async def download_worker(c: Client):
+    while True:
+        job = await JOB_QUEUE.get()
+        token = CURRENT_JOB.set(job)
         try:
-            if uid not in LAST_FILE:
-                if tmp_in.exists():
-                    tmp_in.unlink()
+            if job.cancel_event.is_set():
+                finish_job(job, "cancelled")
+                if job.status_msg:
+                    # কিউর অবস্থান আর Cancel বাটন যেন রয়ে না যায়
+                    try:
+                        await job.status_msg.edit(CANCEL_MSG, reply_markup=None)
+                    except Exception:
+                        pass
+                continue
+            run = run_rename_job if job.kind == "rename" else run_url_job
+            upload = await run(c, job)
+            if upload is not None:
+                # আপলোড আলাদা টাস্কে চলে, worker পরের ডাউনলোড ধরতে পারে
+                job.upload_task = asyncio.create_task(upload)
         except Exception:
-            pass
+            traceback.print_exc()
+            finish_job(job, "failed")
+        finally:
+            CURRENT_JOB.reset(token)
+            JOB_QUEUE.task_done()
+
+def start_job_workers(c: Client):
+    return [asyncio.create_task(download_worker(c)) for _ in range(DOWNLOAD_WORKERS)]
+
+@app.on_message(filters.command("queue") & filters.private)
+async def queue_cmd(c: Client, m: Message):
+    if not is_admin(m.from_user.id):
+        await m.reply_text("আপনার অনুমতি নেই এই কমান্ড চালানোর।")
+        return
+    if not JOBS:
+        await m.reply_text("কিউ খালি, কোনো কাজ চলছে না।")
+        return
+    lines = [job.describe() for job in sorted(JOBS.values(), key=lambda j: j.id)]
+    await m.reply_text("চলমান/অপেক্ষমাণ কাজ:\n" + "\n".join(lines) + "\n\nবাতিল করতে: /cancel <id>")
+
+@app.on_message(filters.command("cancel") & filters.private)
+async def cancel_cmd(c: Client, m: Message):
+    if not is_admin(m.from_user.id):
+        await m.reply_text("আপনার অনুমতি নেই এই কমান্ড চালানোর।")
+        return
+    if len(m.command) < 2 or not m.command[1].lstrip("#").isdigit():
+        await m.reply_text("ব্যবহার: /cancel <id>\nID দেখতে /queue দিন।")
+        return
+    job = JOBS.get(int(m.command[1].lstrip("#")))
+    if not job:
+        await m.reply_text("এই ID এর কোনো কাজ পাওয়া যায়নি।")
+        return
+    job.cancel_event.set()
+    await m.reply_text(f"job #{job.id} বাতিল করা হয়েছে।")
+
+@app.on_message(filters.command("pool") & filters.private)
+async def pool_cmd(c: Client, m: Message):
+    if not is_admin(m.from_user.id):
+        await m.reply_text("আপনার অনুমতি নেই এই কমান্ড চালানোর।")
+        return
+    await m.reply_text("আপলোড session:\n" + UPLOAD_POOL.describe())
+
+@app.on_message(filters.command("stats") & filters.private)
+async def stats_cmd(c: Client, m: Message):
+    if not is_admin(m.from_user.id):
+        await m.reply_text("আপনার অনুমতি নেই এই কমান্ড চালানোর।")
+        return
+    await m.reply_text(stats_text())
+
+async def resend_with_caption(c: Client, m: Message, media_msg: Message, caption: str):
+    # file_id দিয়ে পাঠালে কোনো ডাউনলোড/আপলোড হয় না; তবে ফাইলের ভেতরের নাম আগেরটাই থাকে
+    media = media_msg.video or media_msg.document
+    await c.send_cached_media(chat_id=m.chat.id, file_id=media.file_id, caption=caption)
+
+async def reupload_renamed(c: Client, m: Message, media_msg: Message, new_name: str):
+    """ফাইলের নিজের নাম বদলাতে হলে আসল ডাউনলোড + আপলোড; URL এর মতই কিউতে যায়।"""
+    job = register_job(Job(m, kind="rename"))
+    job.media_msg = media_msg
+    job.name = new_name
+    position = JOB_QUEUE.qsize() + 1
+    job.status_msg = await m.reply_text(
+        f"নাম বদলে আবার আপলোডের জন্য কিউতে যোগ হয়েছে (job #{job.id}, অবস্থান {position})।",
+        reply_markup=progress_keyboard(job.id)
+    )
+    await JOB_QUEUE.put(job)
+    return job
+
+async def rename_download_progress(current, total, c: Client, reporter: ProgressReporter, cancel_event: asyncio.Event):
+    if cancel_event.is_set():
+        # pyrogram এটা পেলে ডাউনলোড থামিয়ে None ফেরত দেয়
+        c.stop_transmission()
+    reporter.update(current, total)
+
+async def run_rename_job(c: Client, job: Job):
+    """rename job এর ডাউনলোড অংশ; সফল হলে আপলোড অংশের coroutine ফেরত দেয়।"""
+    tmp_path = TMP / f"rename_{job.uid}_{job.id}_{job.name}"
+    job.paths.add(str(tmp_path))
+    job.out_path = str(tmp_path)
+    job.status = "downloading"
+    await job.status_msg.edit("টেলিগ্রাম থেকে ফাইল নামানো হচ্ছে...", reply_markup=progress_keyboard())
+    reporter = ProgressReporter(job.status_msg, task="Downloading", start_time=datetime.now())
+    try:
+        async with reporter:
+            path = await job.media_msg.download(
+                file_name=str(tmp_path),
+                progress=rename_download_progress,
+                progress_args=(c, reporter, job.cancel_event),
+            )
+    except Exception as e:
+        await job.status_msg.edit(f"ভিডিও প্রসেসিংয়ে সমস্যা: {e}", reply_markup=None)
+        cleanup_download(job.uid, tmp_path)
+        finish_job(job, "cancelled" if job.cancel_event.is_set() else "failed")
+        return None
+    if job.cancel_event.is_set() or not path:
+        await job.status_msg.edit(CANCEL_MSG, reply_markup=None)
+        cleanup_download(job.uid, tmp_path)
+        finish_job(job, "cancelled" if job.cancel_event.is_set() else "failed")
+        return None
+    job.status = "waiting_upload"
+    return upload_url_job(c, job, tmp_path, job.name)
 
 @app.on_message(filters.video & filters.private & filters.forwarded)
 async def video_forward_rename(c: Client, m: Message):
@@ -403,19 +2995,15 @@ async def video_forward_rename(c: Client, m: Message):
     if not is_admin(uid):
         return
 
-    if uid in TASKS:
-        await m.reply_text("এক সময়ে শুধু একটি কাজ করা যাবে। দয়া করে শেষ হওয়া পর্যন্ত অপেক্ষা করুন।")
+    name = m.video.file_name or "new_video.mp4"
+    if user_thumb(uid) is not None:
+        # file_id দিয়ে পাঠালে কাস্টম থাম্বনেইল বসে না, তাই আগের মত ডাউনলোড করে আবার আপলোড
+        await reupload_renamed(c, m, m, re.sub(r"[\\/*?\"<>|:]", "_", name))
         return
-
-    tmp_video_path = TMP / f"new_video.mp4"
     try:
-        await m.download(file_name=str(tmp_video_path))
-        TASKS[uid] = asyncio.Event()  # create cancel event
-        await process_file_and_upload(c, m, tmp_video_path, original_name="new_video.mp4")
+        await resend_with_caption(c, m, m, name)
     except Exception as e:
-        await m.reply_text(f"ভিডিও প্রসেসিংয়ে সমস্যা: {e}")
-    finally:
-        TASKS.pop(uid, None)
+        await m.reply_text(f"ভিডিও প্রসেসিংয়ে সমস্যা: {e}")
 
 @app.on_message(filters.command("rename") & filters.private)
 async def rename_cmd(c: Client, m: Message):
@@ -423,26 +3011,44 @@ async def rename_cmd(c: Client, m: Message):
     if not is_admin(uid):
         await m.reply_text("আপনার অনুমতি নেই।")
         return
-    if not m.reply_to_message or not m.reply_to_message.video:
-        await m.reply_text("ভিডিও ফাইলের reply দিয়ে এই কমান্ড দিন।\nUsage: /rename new_name.mp4")
+    target = m.reply_to_message
+    if not target or not (target.video or target.document):
+        await m.reply_text("ভিডিও ফাইলের reply দিয়ে এই কমান্ড দিন।\nUsage: /rename new_name.mp4")
         return
     if len(m.command) < 2:
         await m.reply_text("নতুন ফাইল নাম দিন। উদাহরণ: /rename new_video.mp4")
         return
-    new_name = m.text.split(None, 1)[1].strip()
+    args = m.text.split(None, 1)[1].strip()
+    # "-f" দিলে ফাইলের ভেতরের নামও বদলাবে (পুরো ফাইল আবার আপলোড হবে)
+    force_file = args.startswith("-f ")
+    if force_file:
+        args = args[3:].strip()
     # নিরাপদ নাম তৈরির জন্য
-    new_name = re.sub(r"[\\/*?\"<>|:]", "_", new_name)
-    await m.reply_text(f"ভিডিও রিনেম করা হবে: {new_name}\n(এই ফিচারটি আপনার নিজস্ব ভিডিও জন্য কার্যকর, ফরোয়ার্ড ভিডিওর জন্য নয়)")
-    # এখানে আপনার ভিডিও ডাউনলোড এবং upload কোড দিতে পারেন
-    # কিন্তু এই বটে কাজ করা আছে ভিডিও ফরোয়ার্ড অটো rename ফাংশনে
+    new_name = re.sub(r"[\\/*?\"<>|:]", "_", args)
+    if not new_name:
+        await m.reply_text("নতুন ফাইল নাম দিন। উদাহরণ: /rename new_video.mp4")
+        return
+    if force_file:
+        await reupload_renamed(c, m, target, new_name)
+        return
+    try:
+        await resend_with_caption(c, m, target, new_name)
+    except Exception as e:
+        await m.reply_text(f"রিনেম করতে সমস্যা: {e}")
 
-@app.on_callback_query(filters.regex("cancel_task"))
+@app.on_callback_query(filters.regex(r"^cancel_task"))
 async def cancel_task_cb(c, cb):
     uid = cb.from_user.id
-    if uid in TASKS:
-        event = TASKS[uid]
-        event.set()
-        await cb.answer("অপারেশন বাতিল করা হয়েছে।", show_alert=True)
+    _, _, job_id = cb.data.partition(":")
+    if job_id.isdigit():
+        targets = [JOBS[int(job_id)]] if int(job_id) in JOBS else []
+    else:
+        targets = [job for job in JOBS.values() if job.uid == uid]
+    targets = [job for job in targets if job.uid == uid or is_admin(uid)]
+    if targets:
+        for job in targets:
+            job.cancel_event.set()
+        await cb.answer("অপারেশন বাতিল করা হয়েছে।", show_alert=True)
     else:
         await cb.answer("কোনো অপারেশন চলছে না।", show_alert=True)
 
@@ -452,14 +3058,10 @@ async def auto_save_thumb(c, m: Message):
     if not is_admin(m.from_user.id):
         return
     uid = m.from_user.id
-    out = TMP / f"thumb_{uid}.jpg"
+    out = THUMB_DIR / f"thumb_{uid}.jpg"
     try:
         await m.download(file_name=str(out))
-        img = Image.open(out)
-        img.thumbnail((320, 320))
-        img = img.convert("RGB")
-        img.save(out, "JPEG")
-        USER_THUMBS[uid] = str(out)
+        await store_user_thumb(uid, out)
         await m.reply_text("অটো থাম্বনেইল সেভ হয়েছে।")
     except Exception as e:
         await m.reply_text(f"থাম্বনেইল সেভ করতে সমস্যা: {e}")
@@ -471,9 +3073,29 @@ async def auto_url_upload(c, m: Message):
         return
     text = m.text.strip()
     if text.startswith("http://") or text.startswith("https://"):
-        # url detected
-        await handle_url_download_and_upload(c, m, text)
+        # url detected; একাধিক লাইনে একাধিক লিংক থাকলে সবগুলো
+        await enqueue_urls(c, m, extract_urls(text))
+
+async def main():
+    await app.start()
+    await get_http_session()
+    await UPLOAD_POOL.start()
+    metrics_runner = await start_metrics_server()
+    await restore_journal(app)
+    sweep_workspace()
+    asyncio.create_task(workspace_janitor())
+    asyncio.create_task(journal_flusher())
+    start_job_workers(app)
+    print("Bot চালু হয়েছে...")
+    try:
+        await idle()
+    finally:
+        journal_save()
+        await close_http_session()
+        await UPLOAD_POOL.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await app.stop()
 
 if __name__ == "__main__":
-    print("Bot চালু হয়েছে...")
-    app.run()
+    app.run(main())